@@ -1,11 +1,16 @@
-from pydantic_settings import BaseSettings
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+
 from dotenv import load_dotenv
 
-load_dotenv()
-import os
 
+def _env(name: str, default: str = "") -> str:
+    return os.getenv(name, default)
 
-class Settings(BaseSettings):
+
+@dataclass(frozen=True, slots=True)
+class Settings:
     # Gemini (optional — pipeline only)
     gemini_api_key: str = ""
 
@@ -21,20 +26,53 @@ class Settings(BaseSettings):
     elevenlabs_voice_id: str = "EXAVITQu4vr4xnSDxMaL"
 
     # Snowflake (optional — mirrors metadata for cloud queries/demo)
-    snowflake_account: str = os.getenv("SNOWFLAKE_ACCOUNT", "")
-    snowflake_user: str = os.getenv("SNOWFLAKE_USER", "")
-    snowflake_password: str = os.getenv("SNOWFLAKE_PASSWORD", "")
-    snowflake_database: str = os.getenv("SNOWFLAKE_DATABASE", "")
-    snowflake_schema: str = os.getenv("SNOWFLAKE_SCHEMA", "")
-    snowflake_warehouse: str = os.getenv("SNOWFLAKE_WAREHOUSE", "")
+    snowflake_account: str = ""
+    snowflake_user: str = ""
+    snowflake_password: str = ""
+    snowflake_database: str = ""
+    snowflake_schema: str = ""
+    snowflake_warehouse: str = ""
+
+    # Modal (optional — run CLIP and face emotions on the deployed GPU class)
+    modal_vision: bool = False
 
     # App
     max_upload_size_mb: int = 20
     env: str = "development"
 
-    class Config:
-        env_file = ".env"
-        extra = "ignore"
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    load_dotenv()
+    return Settings(
+        gemini_api_key=_env("GEMINI_API_KEY"),
+        presage_api_key=_env("PRESAGE_API_KEY"),
+        presage_api_url=_env("PRESAGE_API_URL", "https://api.presage.io/v1/emotion"),
+        upload_dir=_env("UPLOAD_DIR", "uploads"),
+        elevenlabs_api_key=_env("ELEVENLABS_API_KEY"),
+        elevenlabs_voice_id=_env("ELEVENLABS_VOICE_ID", "EXAVITQu4vr4xnSDxMaL"),
+        snowflake_account=_env("SNOWFLAKE_ACCOUNT"),
+        snowflake_user=_env("SNOWFLAKE_USER"),
+        snowflake_password=_env("SNOWFLAKE_PASSWORD"),
+        snowflake_database=_env("SNOWFLAKE_DATABASE"),
+        snowflake_schema=_env("SNOWFLAKE_SCHEMA"),
+        snowflake_warehouse=_env("SNOWFLAKE_WAREHOUSE"),
+        modal_vision=_env("MODAL_VISION").lower() in ("1", "true", "yes"),
+        max_upload_size_mb=int(_env("MAX_UPLOAD_SIZE_MB", "20")),
+        env=_env("ENV", "development"),
+    )
+
+
+class _LazySettings:
+    """Module-level `settings` that defers reading .env/os.environ until first use."""
+
+    __slots__ = ()
+
+    def __getattr__(self, name: str):
+        return getattr(get_settings(), name)
+
+    def __repr__(self) -> str:
+        return repr(get_settings())
 
 
-settings = Settings()
+settings = _LazySettings()
@@ -1,17 +1,32 @@
 """
 Database helpers — SQLite for metadata, numpy for vector search.
-No external services needed.
+If the optional sqlite-vec extension is installed, unfiltered searches run
+against its vec0 index instead. No external services needed.
 """
 
-import json
 import sqlite3
+import threading
 import uuid
+from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
 import numpy as np
+import orjson
+
+try:
+    import sqlite_vec
+except ImportError:
+    sqlite_vec = None  # optional — falls back to the in-process numpy scan
+
+try:
+    import faiss
+except ImportError:
+    faiss = None  # optional — large libraries get a quantized index when installed
 
 DB_PATH = Path("fotofindr.db")
+EMBEDDING_DIM = 512  # CLIP ViT-B-32
 
 
 # ---------------------------------------------------------------------------
@@ -19,17 +34,80 @@ DB_PATH = Path("fotofindr.db")
 # ---------------------------------------------------------------------------
 
 
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+)
+
+_local = threading.local()
+
+
 def _get_conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    """One long-lived connection per thread.
+
+    Use as `with _get_conn() as conn:` — the context manager wraps the block
+    in a transaction (commit/rollback); it does not close the connection.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        for pragma in _PRAGMAS:
+            conn.execute(pragma)
+        if _vec_enabled:
+            _load_vec(conn)
+        _local.conn = conn
     return conn
 
 
-def _cosine_similarity(a: list[float], b: list[float]) -> float:
-    va = np.array(a, dtype=np.float32)
-    vb = np.array(b, dtype=np.float32)
-    denom = np.linalg.norm(va) * np.linalg.norm(vb)
-    return float(np.dot(va, vb) / denom) if denom else 0.0
+def _load_vec(conn: sqlite3.Connection) -> bool:
+    try:
+        conn.enable_load_extension(True)
+        sqlite_vec.load(conn)
+        conn.enable_load_extension(False)
+        return True
+    except (AttributeError, sqlite3.OperationalError):
+        return False  # Python built without extension loading
+
+
+_vec_enabled = sqlite_vec is not None and _load_vec(sqlite3.connect(":memory:"))
+
+
+def _l2_normalize(x: np.ndarray) -> np.ndarray:
+    """Scale vectors (along the last axis) to unit length; zero vectors stay zero."""
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.where(norms == 0, 1.0, norms)
+
+
+def _now() -> str:
+    """UTC timestamp in the same format as SQLite's datetime('now')."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _dumps(value) -> str:
+    """orjson-encode for a TEXT column."""
+    return orjson.dumps(value).decode()
+
+
+def _to_blob(vec, normalize: bool = True) -> bytes:
+    """Pack an embedding as unit-length little-endian float32 bytes.
+
+    Everything searched is stored pre-normalized, so cosine similarity
+    against a stored vector is a plain dot product. `normalize=False` is
+    only for running sums (people.embedding_sum).
+    """
+    arr = np.asarray(vec, dtype="<f4")
+    if normalize:
+        arr = _l2_normalize(arr)
+    return arr.astype("<f4", copy=False).tobytes()
+
+
+def _from_blob(blob: bytes) -> np.ndarray:
+    """Zero-copy view of a packed float32 embedding."""
+    return np.frombuffer(blob, dtype="<f4")
 
 
 # ---------------------------------------------------------------------------
@@ -49,6 +127,7 @@ CREATE TABLE IF NOT EXISTS photos (
     importance_score REAL DEFAULT 1.0,
     low_value_flags  TEXT DEFAULT '[]',
     embedding        TEXT DEFAULT NULL,
+    embedding_blob   BLOB DEFAULT NULL,
     created_at       TEXT DEFAULT (datetime('now'))
 );
 
@@ -57,12 +136,34 @@ CREATE TABLE IF NOT EXISTS people (
     user_id             TEXT NOT NULL,
     name                TEXT,
     embedding_centroid  TEXT DEFAULT NULL,
+    centroid_blob       BLOB DEFAULT NULL,
+    embedding_sum       BLOB DEFAULT NULL,
     photo_count         INTEGER DEFAULT 0,
     cover_photo_url     TEXT,
     created_at          TEXT DEFAULT (datetime('now'))
 );
 """
 
+# Created after the column migrations so partial indexes can reference
+# columns that older DBs only gain via ALTER TABLE.
+INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_photos_user_created ON photos(user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_photos_user_embed ON photos(user_id) WHERE embedding_blob IS NOT NULL;
+-- Covers get_people's SELECT list, so profile listings never touch the table
+CREATE INDEX IF NOT EXISTS idx_people_user_count
+    ON people(user_id, photo_count DESC, id, name, cover_photo_url);
+"""
+
+# sqlite-vec index over photos.embedding_blob, partitioned by user so a KNN
+# query only touches that user's vectors.
+VEC_SCHEMA_SQL = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS photos_vec USING vec0(
+    photo_id  TEXT PRIMARY KEY,
+    user_id   TEXT PARTITION KEY,
+    embedding float[{EMBEDDING_DIM}] distance_metric=cosine
+)
+"""
+
 
 def init_db() -> None:
     with _get_conn() as conn:
@@ -76,11 +177,54 @@ def init_db() -> None:
             ("low_value_flags",  "TEXT DEFAULT '[]'"),
             ("embedding",        "TEXT DEFAULT NULL"),
             ("device_uri",       "TEXT DEFAULT ''"),
+            ("embedding_blob",   "BLOB DEFAULT NULL"),
         ]:
             try:
                 conn.execute(f"ALTER TABLE photos ADD COLUMN {col} {defn}")
             except sqlite3.OperationalError:
                 pass  # column already exists
+        for col in ("centroid_blob", "embedding_sum"):
+            try:
+                conn.execute(f"ALTER TABLE people ADD COLUMN {col} BLOB DEFAULT NULL")
+            except sqlite3.OperationalError:
+                pass
+
+        conn.executescript(INDEX_SQL)
+        _migrate_json_embeddings(conn)
+
+        if _vec_enabled:
+            conn.execute(VEC_SCHEMA_SQL)
+            # Backfill vectors written before the index existed
+            conn.execute(
+                """INSERT INTO photos_vec (photo_id, user_id, embedding)
+                   SELECT id, user_id, embedding_blob FROM photos
+                   WHERE embedding_blob IS NOT NULL
+                   AND length(embedding_blob) = ?
+                   AND id NOT IN (SELECT photo_id FROM photos_vec)""",
+                (EMBEDDING_DIM * 4,),
+            )
+
+
+def _migrate_json_embeddings(conn: sqlite3.Connection) -> None:
+    """One-shot conversion of legacy JSON-text embeddings to float32 BLOBs."""
+    for table, json_col, blob_col in [
+        ("photos", "embedding", "embedding_blob"),
+        ("people", "embedding_centroid", "centroid_blob"),
+    ]:
+        rows = conn.execute(
+            f"SELECT id, {json_col} FROM {table} WHERE {json_col} IS NOT NULL AND {blob_col} IS NULL"
+        ).fetchall()
+        updates = []
+        for row in rows:
+            try:
+                updates.append((_to_blob(orjson.loads(row[json_col])), row["id"]))
+            except (orjson.JSONDecodeError, TypeError, ValueError):
+                continue
+        if updates:
+            conn.executemany(
+                f"UPDATE {table} SET {blob_col} = ?, {json_col} = NULL WHERE id = ?", updates
+            )
+            print(f"[db] migrated {len(updates)} {table} embeddings to BLOB")
 
 
 # ---------------------------------------------------------------------------
@@ -91,46 +235,161 @@ def init_db() -> None:
 def clear_user_photos(user_id: str) -> None:
     with _get_conn() as conn:
         conn.execute("DELETE FROM photos WHERE user_id = ?", (user_id,))
+        if _vec_enabled:
+            conn.execute("DELETE FROM photos_vec WHERE user_id = ?", (user_id,))
+    _invalidate_vectors(user_id)
+
+
+_INSERT_PHOTO_SQL = (
+    "INSERT OR IGNORE INTO photos (id, user_id, storage_url, device_uri, created_at)"
+    " VALUES (?, ?, ?, ?, ?)"
+)
+
+# Column order matches _pipeline_params
+_PIPELINE_COLUMNS = (
+    "caption", "tags", "detected_objects", "emotions", "person_ids",
+    "importance_score", "low_value_flags", "embedding_blob",
+)
+
+_UPDATE_PIPELINE_SQL = f"""
+UPDATE photos SET {", ".join(f"{col} = ?" for col in _PIPELINE_COLUMNS)}
+WHERE id = ?
+"""
+
+_SYNC_VEC_SQL = f"""
+INSERT INTO photos_vec (photo_id, user_id, embedding)
+SELECT id, user_id, embedding_blob FROM photos
+WHERE id = ? AND length(embedding_blob) = {EMBEDDING_DIM * 4}
+"""
 
 
 def insert_photo(photo_id: str, user_id: str, storage_url: str, device_uri: str = "") -> None:
+    insert_photos_bulk([(photo_id, user_id, storage_url, device_uri)])
+
+
+def insert_photos_bulk(rows: list[tuple[str, str, str, str]]) -> None:
+    """Insert many (photo_id, user_id, storage_url, device_uri) rows in one transaction."""
+    created_at = _now()
     with _get_conn() as conn:
-        conn.execute(
-            "INSERT OR IGNORE INTO photos (id, user_id, storage_url, device_uri) VALUES (?, ?, ?, ?)",
-            (photo_id, user_id, storage_url, device_uri),
-        )
+        conn.executemany(_INSERT_PHOTO_SQL, [(*row, created_at) for row in rows])
 
 
-def update_photo_pipeline_result(photo_id: str, result: dict) -> None:
+def _pipeline_params(photo_id: str, result: dict) -> tuple:
     embedding = result.get("embedding")
-    embedding_json = json.dumps(embedding) if embedding else None
+    return (
+        result.get("caption"),
+        _dumps(result.get("tags", [])),
+        result.get("detected_objects", "[]"),
+        result.get("emotions", "[]"),
+        _dumps(result.get("person_ids", [])),
+        result.get("importance_score", 1.0),
+        _dumps(result.get("low_value_flags", [])),
+        _to_blob(embedding) if embedding is not None and len(embedding) else None,
+        photo_id,
+    )
+
+
+@lru_cache(maxsize=None)
+def _partial_update_sql(columns: tuple[str, ...]) -> str:
+    return f"UPDATE photos SET {', '.join(f'{col} = ?' for col in columns)} WHERE id = ?"
+
+
+def update_photo_pipeline_result(
+    photo_id: str, result: dict, columns: Optional[set[str]] = None
+) -> None:
+    """Write a pipeline result. With `columns`, only those pipeline columns are
+    updated — lets each stage persist its output as soon as it finishes."""
+    if columns is None:
+        update_photo_pipeline_results_bulk([(photo_id, result)])
+        return
+
+    unknown = columns - set(_PIPELINE_COLUMNS)
+    if unknown:
+        raise ValueError(f"Not pipeline columns: {sorted(unknown)}")
+    values = dict(zip(_PIPELINE_COLUMNS, _pipeline_params(photo_id, result)))
+    cols = tuple(col for col in _PIPELINE_COLUMNS if col in columns)
+    with _get_conn() as conn:
+        conn.execute(_partial_update_sql(cols), (*(values[col] for col in cols), photo_id))
+        if _vec_enabled and "embedding_blob" in columns:
+            conn.execute("DELETE FROM photos_vec WHERE photo_id = ?", (photo_id,))
+            conn.execute(_SYNC_VEC_SQL, (photo_id,))
+    _invalidate_vectors(result.get("user_id") or None)
+
 
+def update_photo_pipeline_results_bulk(items: list[tuple[str, dict]]) -> None:
+    """Apply many (photo_id, result) pipeline updates in one transaction."""
+    if not items:
+        return
     with _get_conn() as conn:
-        conn.execute(
-            """
-            UPDATE photos SET
-                caption          = ?,
-                tags             = ?,
-                detected_objects = ?,
-                emotions         = ?,
-                person_ids       = ?,
-                importance_score = ?,
-                low_value_flags  = ?,
-                embedding        = ?
-            WHERE id = ?
-            """,
-            (
-                result.get("caption"),
-                json.dumps(result.get("tags", [])),
-                result.get("detected_objects", "[]"),
-                result.get("emotions", "[]"),
-                json.dumps(result.get("person_ids", [])),
-                result.get("importance_score", 1.0),
-                json.dumps(result.get("low_value_flags", [])),
-                embedding_json,
-                photo_id,
-            ),
-        )
+        conn.executemany(_UPDATE_PIPELINE_SQL, [_pipeline_params(pid, r) for pid, r in items])
+        if _vec_enabled:
+            ids = [(pid,) for pid, _ in items]
+            conn.executemany("DELETE FROM photos_vec WHERE photo_id = ?", ids)
+            conn.executemany(_SYNC_VEC_SQL, ids)
+
+    user_ids = {r.get("user_id") or None for _, r in items}
+    if None in user_ids:
+        _invalidate_vectors()
+    else:
+        for user_id in user_ids:
+            _invalidate_vectors(user_id)
+
+
+# Columns returned to API callers — never the embedding payloads.
+_PHOTO_FIELDS = (
+    "id", "user_id", "storage_url", "device_uri", "caption", "tags", "detected_objects",
+    "emotions", "person_ids", "importance_score", "low_value_flags", "created_at",
+)
+PHOTO_COLUMNS = ", ".join(_PHOTO_FIELDS)
+
+# Read queries are built once so every call hands sqlite3 the identical
+# string and hits the connection's prepared-statement cache.
+_SELECT_USER_VECTORS_SQL = f"""
+SELECT {PHOTO_COLUMNS}, embedding_blob FROM photos
+WHERE user_id = ? AND embedding_blob IS NOT NULL
+"""
+
+# Served by idx_photos_user_embed without touching the table
+_HAS_EMBEDDINGS_SQL = "SELECT 1 FROM photos WHERE user_id = ? AND embedding_blob IS NOT NULL LIMIT 1"
+
+_SELECT_VEC_KNN_SQL = f"""
+WITH knn AS (
+    SELECT photo_id, distance FROM photos_vec
+    WHERE embedding MATCH ? AND k = ? AND user_id = ?
+)
+SELECT {", ".join("p." + f for f in _PHOTO_FIELDS)}, knn.distance FROM knn
+JOIN photos p ON p.id = knn.photo_id
+ORDER BY knn.distance
+"""
+
+# COUNT(col) skips NULLs, so `processed` counts pipeline-processed rows
+_SELECT_STATUS_SQL = (
+    "SELECT COUNT(*) AS total, COUNT(detected_objects) AS processed FROM photos WHERE user_id = ?"
+)
+
+_SELECT_PHOTO_SQL = f"SELECT {PHOTO_COLUMNS} FROM photos WHERE id = ?"
+
+_SELECT_USER_PHOTOS_SQL = f"""
+SELECT {PHOTO_COLUMNS} FROM photos
+WHERE user_id = ?
+ORDER BY created_at DESC
+LIMIT ? OFFSET ?
+"""
+
+_SELECT_UNTAGGED_SQL = f"""
+SELECT {PHOTO_COLUMNS} FROM photos
+WHERE user_id = ?
+AND detected_objects IS NOT NULL
+AND detected_objects = '[]'
+AND (emotions IS NULL OR emotions = '[]')
+ORDER BY created_at DESC
+"""
+
+_SELECT_PEOPLE_SQL = """
+SELECT id, name, photo_count, cover_photo_url FROM people
+WHERE user_id = ?
+ORDER BY photo_count DESC
+"""
 
 
 def _row_to_dict(row) -> dict:
@@ -138,113 +397,340 @@ def _row_to_dict(row) -> dict:
     for key in ("tags", "detected_objects", "emotions", "person_ids", "low_value_flags"):
         if isinstance(d.get(key), str):
             try:
-                d[key] = json.loads(d[key])
-            except (json.JSONDecodeError, TypeError):
+                d[key] = orjson.loads(d[key])
+            except orjson.JSONDecodeError:
                 d[key] = []
     d.pop("embedding", None)
+    d.pop("embedding_blob", None)
     return d
 
 
+# ---------------------------------------------------------------------------
+# Vector search
+# ---------------------------------------------------------------------------
+
+# user_id -> (photo dicts, (N, D) float32 matrix of L2-normalized embeddings).
+# Rebuilt lazily on the next search after any write that touches embeddings.
+_vector_cache: dict[str, tuple[list[dict], np.ndarray]] = {}
+
+# user_id -> FAISS index over the same matrix (row i == photos[i]). Codes are
+# 8-bit scalar-quantized, so a scan streams a quarter of the float32 bytes;
+# candidates are re-scored exactly against the matrix. Libraries of at least
+# SQ8_MIN_PHOTOS get a flat SQ8 scan, HNSW_MIN_PHOTOS and up an HNSW graph.
+# Below that one exact matmul is faster than either.
+SQ8_MIN_PHOTOS = 10_000
+HNSW_MIN_PHOTOS = 100_000
+HNSW_M = 32
+# efSearch scales with the candidates asked for (HNSW_EF_PER_K x k, floor
+# HNSW_EF_SEARCH) — a fixed 64 lost most of the true top 20 at these sizes.
+HNSW_EF_SEARCH = 64
+HNSW_EF_PER_K = 16
+_faiss_cache: dict[str, "faiss.Index"] = {}
+
+# user_id -> {serialized filters: boolean row mask over that user's matrix}.
+# Repeated filtered searches reuse the mask instead of re-running
+# _matches_filters over every photo dict. Dropped with the matrix.
+_MASK_CACHE_SIZE = 64
+_mask_cache: dict[str, dict[bytes, np.ndarray]] = {}
+
+
+# Semantic result cache: the last _RESULT_CACHE_SIZE searches, with their query
+# embeddings in one contiguous (K, D) matrix so a lookup is a single
+# matrix-vector product. A query within _RESULT_CACHE_MIN_SIM cosine of a
+# cached one (same user, filters and limit) gets that search's results back.
+_RESULT_CACHE_SIZE = 512
+_RESULT_CACHE_MIN_SIM = 0.95
+_result_lock = threading.Lock()
+_result_embs = np.zeros((_RESULT_CACHE_SIZE, EMBEDDING_DIM), dtype=np.float32)
+_result_keys: list[Optional[tuple]] = [None] * _RESULT_CACHE_SIZE
+_result_rows: list[Optional[list[dict]]] = [None] * _RESULT_CACHE_SIZE
+_result_next = 0
+
+# Bumped (under _result_lock) on every invalidation. Readers note it before
+# querying SQLite and only store what they built if it hasn't moved, so a
+# write landing mid-read can't leave a stale matrix, mask, index or result
+# set cached.
+_cache_generation = 0
+
+
+def _store_if_current(cache: dict, key, value, generation: int) -> None:
+    with _result_lock:
+        if generation == _cache_generation:
+            cache[key] = value
+
+
+def _invalidate_vectors(user_id: Optional[str] = None) -> None:
+    global _cache_generation
+    with _result_lock:
+        if user_id is None:
+            _vector_cache.clear()
+            _faiss_cache.clear()
+            _mask_cache.clear()
+        else:
+            _vector_cache.pop(user_id, None)
+            _faiss_cache.pop(user_id, None)
+            _mask_cache.pop(user_id, None)
+
+        _cache_generation += 1
+        for i, key in enumerate(_result_keys):
+            if key is not None and (user_id is None or key[0] == user_id):
+                _result_keys[i] = _result_rows[i] = None
+                _result_embs[i] = 0.0
+
+
+def _filters_key(filters: Optional[dict]) -> Optional[bytes]:
+    try:
+        return orjson.dumps(filters or {}, default=sorted, option=orjson.OPT_SORT_KEYS)
+    except TypeError:
+        return None  # unhashable filter values — just don't cache
+
+
+def _result_key(user_id: str, filters: Optional[dict], limit: int) -> Optional[tuple]:
+    filters_key = _filters_key(filters)
+    return None if filters_key is None else (user_id, filters_key, limit)
+
+
+def _cached_results(key: tuple, q: np.ndarray) -> Optional[list[dict]]:
+    with _result_lock:
+        sims = _result_embs @ q
+        candidates = np.flatnonzero(sims >= _RESULT_CACHE_MIN_SIM)
+        for i in candidates[np.argsort(-sims[candidates])]:
+            if _result_keys[i] == key:
+                return [dict(p) for p in _result_rows[i]]
+    return None
+
+
+def _cache_results(key: tuple, q: np.ndarray, results: list[dict], generation: int) -> None:
+    global _result_next
+    with _result_lock:
+        if generation != _cache_generation:
+            return
+        i = _result_next
+        _result_embs[i] = q
+        _result_keys[i] = key
+        _result_rows[i] = [dict(p) for p in results]
+        _result_next = (i + 1) % _RESULT_CACHE_SIZE
+
+
+def _user_vectors(user_id: str) -> tuple[list[dict], np.ndarray, int]:
+    """(photos, matrix, generation) — pass the generation on when caching
+    anything derived from the matrix."""
+    generation = _cache_generation
+    cached = _vector_cache.get(user_id)
+    if cached is not None:
+        return (*cached, generation)
+
+    with _get_conn() as conn:
+        rows = conn.execute(_SELECT_USER_VECTORS_SQL, (user_id,)).fetchall()
+
+    photos = [_row_to_dict(row) for row in rows]
+    if rows:
+        # One join + one reshape: the (N, D) matrix is a single contiguous
+        # buffer with no per-row intermediate arrays.
+        blob = b"".join(row["embedding_blob"] for row in rows)
+        matrix = np.frombuffer(blob, dtype="<f4").reshape(len(rows), -1)
+    else:
+        matrix = np.empty((0, 0), dtype=np.float32)
+
+    _store_if_current(_vector_cache, user_id, (photos, matrix), generation)
+    return photos, matrix, generation
+
+
+def _has_embeddings(user_id: str) -> bool:
+    with _get_conn() as conn:
+        return conn.execute(_HAS_EMBEDDINGS_SQL, (user_id,)).fetchone() is not None
+
+
+def _matches_filters(photo: dict, filters: dict) -> bool:
+    # Filter: "me" / specific person_id must appear in photo's person_ids
+    if filters.get("person_id"):
+        if filters["person_id"] not in photo.get("person_ids", []):
+            return False
+
+    # Filter: at least one object keyword must match a detected object label.
+    # If a photo has no YOLO data yet (empty list), skip the filter and let
+    # CLIP similarity handle ranking instead.
+    if filters.get("objects"):
+        objs = photo.get("detected_objects", [])
+        obj_labels = {o.get("label", "").lower() for o in objs if isinstance(o, dict)}
+        if obj_labels and obj_labels.isdisjoint(filters["objects"]):
+            return False
+
+    # Filter: emotion
+    if filters.get("emotion"):
+        wanted = filters["emotion"].lower()
+        if not any(
+            e.get("dominant", "").lower() == wanted
+            for e in photo.get("emotions", [])
+            if isinstance(e, dict)
+        ):
+            return False
+
+    if filters.get("exclude_low_value"):
+        score = photo.get("importance_score", 1.0) or 1.0
+        if score < 0.4:
+            return False
+
+    return True
+
+
+def _filter_mask(
+    user_id: str, photos: list[dict], filters: dict, generation: int
+) -> np.ndarray:
+    """Boolean mask of the photos passing `filters`, cached per user."""
+    key = _filters_key(filters)
+    mask = _mask_cache.get(user_id, {}).get(key) if key is not None else None
+    if mask is None:
+        mask = np.fromiter(
+            (_matches_filters(p, filters) for p in photos), dtype=bool, count=len(photos)
+        )
+        if key is not None:
+            with _result_lock:
+                if generation == _cache_generation:
+                    masks = _mask_cache.setdefault(user_id, {})
+                    if len(masks) >= _MASK_CACHE_SIZE:
+                        masks.clear()
+                    masks[key] = mask
+    return mask
+
+
 def search_photos_by_vector(
-    embedding: list[float],
+    embedding: "np.ndarray | list[float]",
     user_id: str,
     filters: Optional[dict] = None,
     limit: int = 20,
 ) -> list[dict]:
-    """In-memory cosine similarity search with optional metadata filters."""
+    """Cosine similarity search (one matrix-vector product) with optional metadata filters."""
+    if user_id not in _vector_cache and not _has_embeddings(user_id):
+        return []  # e.g. a new user whose uploads are still in the pipeline
+
+    q = _l2_normalize(np.asarray(embedding, dtype=np.float32))
+    key = _result_key(user_id, filters, limit) if len(q) == EMBEDDING_DIM else None
+    if key is not None:
+        hit = _cached_results(key, q)
+        if hit is not None:
+            return hit
+    generation = _cache_generation
+
+    # FAISS, when installed, supersedes the sqlite-vec scan (see _search_matrix)
+    if _vec_enabled and faiss is None and not filters and len(q) == EMBEDDING_DIM:
+        results = _search_vec_index(q, user_id, limit)
+    else:
+        results = _search_matrix(q, user_id, filters, limit)
+
+    if key is not None:
+        _cache_results(key, q, results, generation)
+    return results
+
+
+def _user_faiss(user_id: str, matrix: np.ndarray, generation: int) -> "faiss.Index":
+    index = _faiss_cache.get(user_id)
+    if index is None:
+        qtype = faiss.ScalarQuantizer.QT_8bit
+        if len(matrix) >= HNSW_MIN_PHOTOS:
+            index = faiss.IndexHNSWSQ(matrix.shape[1], qtype, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+        else:
+            index = faiss.IndexScalarQuantizer(matrix.shape[1], qtype, faiss.METRIC_INNER_PRODUCT)
+        index.train(matrix)  # per-dimension value ranges for the 8-bit codes
+        index.add(matrix)
+        _store_if_current(_faiss_cache, user_id, index, generation)
+    return index
+
+
+def _search_faiss(
+    q: np.ndarray, user_id: str, photos: list[dict], matrix: np.ndarray,
+    generation: int, filters: Optional[dict], limit: int,
+) -> Optional[list[dict]]:
+    """Candidates from the SQ8 index (2x over-fetch, 4x when filtering),
+    re-scored exactly. Returns None if too few candidates survive the filters
+    so the caller can fall back to the exact scan."""
+    k = min(len(photos), limit * 4 if filters else limit * 2)
+    index = _user_faiss(user_id, matrix, generation)
+    params = None
+    if isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(efSearch=max(HNSW_EF_SEARCH, HNSW_EF_PER_K * k))
+    _, ids = index.search(q[None, :], k, params=params)
+    ids = ids[0][ids[0] >= 0]
+    if filters:
+        ids = ids[_filter_mask(user_id, photos, filters, generation)[ids]]
+    if len(ids) < limit and k < len(photos):
+        return None
+    sims = matrix[ids] @ q
+    order = np.argsort(-sims, kind="stable")[:limit]
+    return [{**photos[ids[j]], "similarity": float(sims[j])} for j in order]
+
+
+def _search_matrix(q: np.ndarray, user_id: str, filters: Optional[dict], limit: int) -> list[dict]:
+    photos, matrix, generation = _user_vectors(user_id)
+    if not photos or limit <= 0:
+        return []
+
+    if faiss is not None and len(photos) >= SQ8_MIN_PHOTOS and matrix.shape[1] == len(q):
+        results = _search_faiss(q, user_id, photos, matrix, generation, filters, limit)
+        if results is not None:
+            return results
+
+    sims = matrix @ q
+
+    if filters:
+        idx = np.flatnonzero(_filter_mask(user_id, photos, filters, generation))
+    else:
+        idx = np.arange(len(photos))
+
+    # Partial selection of the top `limit`, then sort only those
+    if len(idx) > limit:
+        idx = idx[np.argpartition(-sims[idx], limit)[:limit]]
+    idx = idx[np.argsort(-sims[idx], kind="stable")]
+
+    return [{**photos[i], "similarity": float(sims[i])} for i in idx]
+
+
+def _search_vec_index(embedding: "np.ndarray | list[float]", user_id: str, limit: int) -> list[dict]:
+    """KNN over the sqlite-vec index; the scan runs in C inside SQLite."""
+    if limit <= 0:
+        return []
     with _get_conn() as conn:
         rows = conn.execute(
-            "SELECT * FROM photos WHERE user_id = ? AND embedding IS NOT NULL",
-            (user_id,),
+            _SELECT_VEC_KNN_SQL, (_to_blob(embedding), limit, user_id)
         ).fetchall()
-
-    scored = []
+    results = []
     for row in rows:
-        d = dict(row)
-        try:
-            row_emb = json.loads(d["embedding"])
-        except (json.JSONDecodeError, TypeError):
-            continue
-
-        if filters:
-            # Filter: "me" / specific person_id must appear in photo's person_ids
-            if filters.get("person_id"):
-                pids_raw = d.get("person_ids", "[]")
-                pids = json.loads(pids_raw) if isinstance(pids_raw, str) else pids_raw
-                if filters["person_id"] not in pids:
-                    continue
-
-            # Filter: at least one object keyword must match a detected object label.
-            # If a photo has no YOLO data yet (empty list), skip the filter and let
-            # CLIP similarity handle ranking instead.
-            if filters.get("objects"):
-                obj_raw = d.get("detected_objects", "[]")
-                objs = json.loads(obj_raw) if isinstance(obj_raw, str) else obj_raw
-                obj_labels = {o.get("label", "").lower() for o in objs if isinstance(o, dict)}
-                if obj_labels and not any(kw in obj_labels for kw in filters["objects"]):
-                    continue
-
-            # Filter: emotion
-            if filters.get("emotion"):
-                emotions_raw = d.get("emotions", "[]")
-                emotions = json.loads(emotions_raw) if isinstance(emotions_raw, str) else emotions_raw
-                dominant_emotions = [e.get("dominant", "") for e in emotions if isinstance(e, dict)]
-                if filters["emotion"].lower() not in [e.lower() for e in dominant_emotions]:
-                    continue
-
-            if filters.get("exclude_low_value"):
-                score = d.get("importance_score", 1.0) or 1.0
-                if score < 0.4:
-                    continue
-
-        sim = _cosine_similarity(embedding, row_emb)
-        d["similarity"] = sim
-        scored.append(d)
-
-    scored.sort(key=lambda x: x["similarity"], reverse=True)
-    return [_row_to_dict(d) for d in scored[:limit]]
+        d = _row_to_dict(row)
+        d["similarity"] = 1.0 - d.pop("distance")
+        results.append(d)
+    return results
 
 
 def get_pipeline_status(user_id: str) -> dict:
     with _get_conn() as conn:
-        total = conn.execute(
-            "SELECT COUNT(*) FROM photos WHERE user_id = ?", (user_id,)
-        ).fetchone()[0]
-        processed = conn.execute(
-            "SELECT COUNT(*) FROM photos WHERE user_id = ? AND detected_objects IS NOT NULL",
-            (user_id,),
-        ).fetchone()[0]
-    return {"processed": processed, "total": total}
+        row = conn.execute(_SELECT_STATUS_SQL, (user_id,)).fetchone()
+    return {"processed": row["processed"], "total": row["total"]}
 
 
 def get_photo_by_id(photo_id: str) -> dict | None:
     with _get_conn() as conn:
-        row = conn.execute("SELECT * FROM photos WHERE id = ?", (photo_id,)).fetchone()
-    return _row_to_dict(dict(row)) if row else None
+        row = conn.execute(_SELECT_PHOTO_SQL, (photo_id,)).fetchone()
+    return _row_to_dict(row) if row else None
 
 
-def get_all_photos_for_user(user_id: str) -> list[dict]:
+def get_all_photos_for_user(
+    user_id: str, limit: Optional[int] = 100, offset: int = 0
+) -> list[dict]:
+    """Newest first, one page of `limit` rows. Pass `limit=None` explicitly for
+    every photo (SQLite treats LIMIT -1 as unbounded)."""
     with _get_conn() as conn:
         rows = conn.execute(
-            "SELECT * FROM photos WHERE user_id = ? ORDER BY created_at DESC",
-            (user_id,),
+            _SELECT_USER_PHOTOS_SQL, (user_id, -1 if limit is None else limit, offset)
         ).fetchall()
-    return [_row_to_dict(dict(row)) for row in rows]
+    return [_row_to_dict(row) for row in rows]
 
 
 def get_untagged_photos(user_id: str) -> list[dict]:
     """Photos that ran through the pipeline but have no detected objects or emotions."""
     with _get_conn() as conn:
-        rows = conn.execute(
-            """SELECT * FROM photos
-               WHERE user_id = ?
-               AND detected_objects IS NOT NULL
-               AND detected_objects = '[]'
-               AND (emotions IS NULL OR emotions = '[]')
-               ORDER BY created_at DESC""",
-            (user_id,),
-        ).fetchall()
-    return [_row_to_dict(dict(row)) for row in rows]
+        rows = conn.execute(_SELECT_UNTAGGED_SQL, (user_id,)).fetchall()
+    return [_row_to_dict(row) for row in rows]
 
 
 # ---------------------------------------------------------------------------
@@ -252,53 +738,142 @@ def get_untagged_photos(user_id: str) -> list[dict]:
 # ---------------------------------------------------------------------------
 
 
-def get_or_create_person(
-    user_id: str, embedding: list[float], threshold: float = 0.75
-) -> str:
-    with _get_conn() as conn:
-        rows = conn.execute(
-            "SELECT id, embedding_centroid FROM people WHERE user_id = ? AND embedding_centroid IS NOT NULL",
-            (user_id,),
-        ).fetchall()
+# user_id -> (person ids, (P, D) unit centroids, running embedding sums).
+# Kept in step with every write in get_or_create_person_batch — the only
+# writer of centroids — so matching a face never re-reads the people table.
+_people_cache: dict[str, tuple[list[str], np.ndarray, list[np.ndarray]]] = {}
+_people_lock = threading.Lock()
+
+
+def _load_people(conn: sqlite3.Connection, user_id: str, dim: int):
+    rows = conn.execute(
+        """SELECT id, centroid_blob, embedding_sum, photo_count FROM people
+           WHERE user_id = ? AND centroid_blob IS NOT NULL""",
+        (user_id,),
+    ).fetchall()
+    ids = [str(row["id"]) for row in rows]
+    if rows:
+        centroids = np.stack([_from_blob(row["centroid_blob"]) for row in rows])
+    else:
+        centroids = np.empty((0, dim), dtype=np.float32)
+    sums = [
+        _from_blob(row["embedding_sum"]) if row["embedding_sum"] is not None
+        # Person predates running sums — seed from the fixed centroid
+        else centroids[i] * (row["photo_count"] or 1)
+        for i, row in enumerate(rows)
+    ]
+    return ids, centroids, sums
 
-    best_id = None
-    best_sim = 0.0
-    for row in rows:
-        try:
-            centroid = json.loads(row["embedding_centroid"])
-        except (json.JSONDecodeError, TypeError):
-            continue
-        sim = _cosine_similarity(embedding, centroid)
-        if sim > best_sim:
-            best_sim = sim
-            best_id = str(row["id"])
-
-    if best_sim >= threshold and best_id:
-        with _get_conn() as conn:
-            conn.execute(
-                "UPDATE people SET photo_count = photo_count + 1 WHERE id = ?",
-                (best_id,),
-            )
-        return best_id
 
-    person_id = str(uuid.uuid4())
-    with _get_conn() as conn:
-        conn.execute(
-            "INSERT INTO people (id, user_id, embedding_centroid, photo_count) VALUES (?, ?, ?, 1)",
-            (person_id, user_id, json.dumps(embedding)),
+def get_or_create_person(
+    user_id: str, embedding: "np.ndarray | list[float]", threshold: float = 0.75
+) -> str:
+    return get_or_create_person_batch(user_id, [embedding], threshold)[0]
+
+
+def get_or_create_person_batch(
+    user_id: str, embeddings: "np.ndarray | list[list[float]]", threshold: float = 0.75
+) -> list[str]:
+    """
+    Match each face embedding to the closest person centroid, or start a new person.
+    `embeddings` is ideally an (F, D) float32 array; returns one person_id per row.
+
+    Each person keeps a running `embedding_sum` of matched faces (the
+    face count is `photo_count`); `centroid_blob` is that sum normalized,
+    so the centroid keeps improving as more faces are matched. Faces are
+    assigned in order, so a person created for one face in the batch can
+    absorb later faces, exactly as with sequential calls — but the whole
+    batch is one executemany per write kind, and centroids are only read
+    from SQLite the first time a user is seen.
+    """
+    if not len(embeddings):
+        return []
+    faces = _l2_normalize(np.asarray(embeddings, dtype=np.float32))
+
+    with _people_lock, _get_conn() as conn:
+        cached = _people_cache.get(user_id)
+        if cached is None:
+            cached = _load_people(conn, user_id, faces.shape[1])
+        # Work on copies so a failed write leaves the cache untouched
+        ids, centroids, sums = list(cached[0]), cached[1].copy(), list(cached[2])
+        existing = len(ids)
+        added = [0] * existing
+
+        person_ids: list[str] = []
+        for face in faces:
+            if ids:
+                sims = centroids @ face
+                best = int(np.argmax(sims))
+                if sims[best] >= threshold:
+                    sums[best] = sums[best] + face
+                    added[best] += 1
+                    centroids[best] = _l2_normalize(sums[best])
+                    person_ids.append(ids[best])
+                    continue
+            ids.append(str(uuid.uuid4()))
+            sums.append(face)
+            added.append(1)
+            centroids = np.vstack([centroids, face])
+            person_ids.append(ids[-1])
+
+        conn.executemany(
+            """UPDATE people SET
+                   photo_count   = photo_count + ?,
+                   embedding_sum = ?,
+                   centroid_blob = ?
+               WHERE id = ?""",
+            [
+                (added[i], _to_blob(sums[i], normalize=False), _to_blob(sums[i]), ids[i])
+                for i in range(existing)
+                if added[i]
+            ],
         )
-    return person_id
+        now = _now()
+        conn.executemany(
+            """INSERT INTO people (id, user_id, centroid_blob, embedding_sum, photo_count, created_at)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            [
+                (ids[i], user_id, _to_blob(sums[i]), _to_blob(sums[i], normalize=False), added[i], now)
+                for i in range(existing, len(ids))
+            ],
+        )
+        conn.commit()
+        _people_cache[user_id] = (ids, centroids, sums)
+        _invalidate_people(user_id)
+    return person_ids
 
 
 def name_person(person_id: str, name: str) -> None:
     with _get_conn() as conn:
         conn.execute("UPDATE people SET name = ? WHERE id = ?", (name, person_id))
+    _invalidate_people()  # person_id alone doesn't tell us the user
+
+
+# user_id -> profile rows, dropped whenever a person is created, matched or renamed.
+# Same generation scheme as the vector caches, so a read racing a write isn't stored.
+_people_list_cache: dict[str, list[dict]] = {}
+_people_list_lock = threading.Lock()
+_people_generation = 0
+
+
+def _invalidate_people(user_id: Optional[str] = None) -> None:
+    global _people_generation
+    with _people_list_lock:
+        if user_id is None:
+            _people_list_cache.clear()
+        else:
+            _people_list_cache.pop(user_id, None)
+        _people_generation += 1
 
 
 def get_people(user_id: str) -> list[dict]:
-    with _get_conn() as conn:
-        rows = conn.execute(
-            "SELECT id, name, photo_count, cover_photo_url FROM people WHERE user_id = ? ORDER BY photo_count DESC",
-            (user_id,),
-        ).fetchall()
-    return [dict(row) for row in rows]
+    generation = _people_generation
+    cached = _people_list_cache.get(user_id)
+    if cached is None:
+        with _get_conn() as conn:
+            rows = conn.execute(_SELECT_PEOPLE_SQL, (user_id,)).fetchall()
+        cached = [dict(row) for row in rows]
+        with _people_list_lock:
+            if generation == _people_generation:
+                _people_list_cache[user_id] = cached
+    return [dict(p) for p in cached]
@@ -39,50 +39,62 @@ User query: "{query}"
 Available detected objects: {json.dumps(object_labels)}
 Available detected emotions: {json.dumps(emotion_labels)}
 
-Return ONLY a JSON array of items from the above lists that are relevant to the query.
-Do not add items that are not in the lists. Do not explain. Just the JSON array.
-
-Example output: ["dog", "happy"]
-"""
+Return the items from the above lists that are relevant to the query.
+Do not add items that are not in the lists."""
 
     try:
         response = _get_client().models.generate_content(
             model=MODEL,
             contents=prompt,
+            # Structured output — response.text is guaranteed to be a JSON list of strings
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=list[str],
+            ),
         )
-        text = response.text.strip()
-        if text.startswith("```"):
-            text = text.split("```")[1]
-            if text.startswith("json"):
-                text = text[4:]
-        return json.loads(text.strip())
+        labels = json.loads(response.text)
     except Exception as e:
         print(f"[gemini] find_matching_labels error: {e}")
         return []
 
+    allowed = set(object_labels) | set(emotion_labels)
+    return [label for label in labels if label in allowed]
+
+
+def _join_labels(labels: list, n: int) -> str:
+    return ", ".join(map(str, labels[:n]))
+
 
 def _label_fallback_description(objects: list, emotions: list) -> str:
     """Build a simple description from labels when Gemini is unavailable."""
     parts = []
     if objects:
-        parts.append(f"This photo contains {', '.join(str(o) for o in objects[:5])}")
+        parts.append(f"This photo contains {_join_labels(objects, 5)}")
     if emotions:
-        parts.append(f"The people appear {', '.join(str(e) for e in emotions[:3])}")
+        parts.append(f"The people appear {_join_labels(emotions, 3)}")
     return ". ".join(parts) + "." if parts else "A photo from your camera roll."
 
 
+_DESCRIBE_PROMPT = """You are describing an image for a user.
+Using the image and the tags below, generate a natural, conversational description.
+Keep it 1-3 sentences.
+"""
+
+# 1-3 sentences never needs more than ~120 tokens; capping decode is most of the latency win
+_DESCRIBE_CONFIG = types.GenerateContentConfig(max_output_tokens=120, temperature=0.4)
+
+
 def generate_description(image_bytes: bytes, objects: list, emotions: list) -> str:
     """Generate a natural language description of an image using Gemini vision.
     Falls back to a label-based description if the API is unavailable or rate-limited."""
     if not settings.gemini_api_key:
         return _label_fallback_description(objects, emotions)
 
-    prompt = f"""You are describing an image for a user.
-Detected objects: {objects}
-Detected emotions: {emotions}
-
-Using the image and these tags, generate a natural, conversational description.
-Keep it 1-3 sentences."""
+    prompt = (
+        f"{_DESCRIBE_PROMPT}"
+        f"Detected objects: {_join_labels(objects, 5)}\n"
+        f"Detected emotions: {_join_labels(emotions, 3)}"
+    )
 
     try:
         response = _get_client().models.generate_content(
@@ -91,6 +103,7 @@ Keep it 1-3 sentences."""
                 prompt,
                 types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg"),
             ],
+            config=_DESCRIBE_CONFIG,
         )
         return response.text.strip()
     except Exception as e:
@@ -6,15 +6,29 @@ Data is written to backend/snowflake_test.db.
 
 import json
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 
 _DB_PATH = Path(__file__).parent / "snowflake_test.db"
 
+# One connection for the life of the process — writes are serialised by _lock
+_conn: sqlite3.Connection | None = None
+_lock = threading.Lock()
 
-def _get_conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+
+@contextmanager
+def _get_conn():
+    global _conn
+    with _lock:
+        if _conn is None:
+            _conn = sqlite3.connect(_DB_PATH, check_same_thread=False)
+            _conn.row_factory = sqlite3.Row
+            _conn.execute("PRAGMA journal_mode=WAL")
+            _conn.execute("PRAGMA synchronous=NORMAL")
+            _conn.execute("PRAGMA temp_store=MEMORY")
+        with _conn:
+            yield _conn
 
 
 def init_schema() -> None:
@@ -48,35 +62,38 @@ def insert_photo(photo_id: str, device_uri: str, user_id: str) -> None:
         print(f"[local_test_db] insert_photo failed: {e}")
 
 
+_UPSERT_PHOTO_SQL = """
+    INSERT INTO photos (ID, FILENAME, METADATA, YOLO_DATA, DEEPFACE_DATA)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(ID) DO UPDATE SET
+        METADATA      = excluded.METADATA,
+        YOLO_DATA     = excluded.YOLO_DATA,
+        DEEPFACE_DATA = excluded.DEEPFACE_DATA
+"""
+
+
+def _upsert_params(photo_id: str, filename: str, result: dict) -> tuple:
+    metadata = json.dumps({
+        "user_id":          result.get("user_id", ""),
+        "caption":          result.get("caption"),
+        "tags":             result.get("tags", []),
+        "importance_score": result.get("importance_score", 1.0),
+        "low_value_flags":  result.get("low_value_flags", []),
+        "person_ids":       result.get("person_ids", []),
+    })
+    return (
+        photo_id,
+        filename,
+        metadata,
+        result.get("detected_objects", "[]"),
+        result.get("emotions", "[]"),
+    )
+
+
 def upsert_photo(photo_id: str, filename: str, result: dict) -> None:
     try:
-        metadata = json.dumps({
-            "user_id":          result.get("user_id", ""),
-            "caption":          result.get("caption"),
-            "tags":             result.get("tags", []),
-            "importance_score": result.get("importance_score", 1.0),
-            "low_value_flags":  result.get("low_value_flags", []),
-            "person_ids":       result.get("person_ids", []),
-        })
-        yolo_raw     = result.get("detected_objects", "[]")
-        deepface_raw = result.get("emotions", "[]")
-
         with _get_conn() as conn:
-            cur = conn.execute(
-                """
-                UPDATE photos SET METADATA=?, YOLO_DATA=?, DEEPFACE_DATA=?
-                WHERE ID=?
-                """,
-                (metadata, yolo_raw, deepface_raw, photo_id),
-            )
-            if cur.rowcount == 0:
-                conn.execute(
-                    """
-                    INSERT INTO photos (ID, FILENAME, METADATA, YOLO_DATA, DEEPFACE_DATA)
-                    VALUES (?, ?, ?, ?, ?)
-                    """,
-                    (photo_id, filename, metadata, yolo_raw, deepface_raw),
-                )
+            conn.execute(_UPSERT_PHOTO_SQL, _upsert_params(photo_id, filename, result))
         print(f"[local_test_db] upsert_photo ok: {photo_id}")
     except Exception as e:
         print(f"[local_test_db] upsert_photo failed: {e}")
@@ -86,6 +103,94 @@ def update_photo_pipeline_result(photo_id: str, result: dict) -> None:
     upsert_photo(photo_id, f"/uploads/{photo_id}.jpg", result)
 
 
+def upsert_photos_bulk(items: list[tuple[str, str, dict]]) -> None:
+    """Upsert many (photo_id, filename, result) rows in one transaction with executemany."""
+    try:
+        with _get_conn() as conn:
+            conn.executemany(
+                _UPSERT_PHOTO_SQL,
+                [_upsert_params(pid, filename, result) for pid, filename, result in items],
+            )
+        print(f"[local_test_db] upsert_photos_bulk ok: {len(items)} photos")
+    except Exception as e:
+        print(f"[local_test_db] upsert_photos_bulk failed: {e}")
+
+
+def search_photos_by_vector(
+    embedding: list[float],
+    user_id: str,
+    filters: dict | None = None,
+    limit: int = 20,
+) -> list[dict]:
+    """No EMBEDDING column locally — nothing to rank, same as an un-embedded library."""
+    return []
+
+
+_DISTINCT_LABELS_SQL = """
+SELECT DISTINCT 'object', json_extract(o.value, '$.label')
+FROM photos p, json_each(p.YOLO_DATA) o
+WHERE json_extract(p.METADATA, '$.user_id') = ? AND json_extract(o.value, '$.label') IS NOT NULL
+UNION
+SELECT DISTINCT 'emotion', json_extract(e.value, '$.dominant_emotion')
+FROM photos p, json_each(p.DEEPFACE_DATA) e
+WHERE json_extract(p.METADATA, '$.user_id') = ? AND json_extract(e.value, '$.dominant_emotion') IS NOT NULL
+"""
+
+
+def get_distinct_labels(user_id: str) -> tuple[list[str], list[str]]:
+    """(object labels, dominant emotions) across the user's photos."""
+    try:
+        with _get_conn() as conn:
+            rows = conn.execute(_DISTINCT_LABELS_SQL, (user_id, user_id)).fetchall()
+    except Exception as e:
+        print(f"[local_test_db] get_distinct_labels failed: {e}")
+        return [], []
+
+    objects = [label for kind, label in rows if kind == "object"]
+    emotions = [label for kind, label in rows if kind == "emotion"]
+    return objects, emotions
+
+
+_PHOTOS_WITH_LABELS_SQL = """
+SELECT ID, METADATA, YOLO_DATA, DEEPFACE_DATA
+FROM photos
+WHERE ID IN (
+    SELECT p.ID
+    FROM photos p, json_each(p.YOLO_DATA) o, json_each(?) w
+    WHERE json_extract(p.METADATA, '$.user_id') = ? AND json_extract(o.value, '$.label') = w.value
+    UNION
+    SELECT p.ID
+    FROM photos p, json_each(p.DEEPFACE_DATA) e, json_each(?) w
+    WHERE json_extract(p.METADATA, '$.user_id') = ? AND json_extract(e.value, '$.dominant_emotion') = w.value
+)
+"""
+
+
+def get_photos_with_labels(user_id: str, labels: list[str]) -> list[dict]:
+    """The user's photos with at least one YOLO label or dominant emotion in `labels`."""
+    if not labels:
+        return []
+    wanted = json.dumps(labels)
+    try:
+        with _get_conn() as conn:
+            rows = conn.execute(_PHOTOS_WITH_LABELS_SQL, (wanted, user_id, wanted, user_id)).fetchall()
+    except Exception as e:
+        print(f"[local_test_db] get_photos_with_labels failed: {e}")
+        return []
+
+    photos = []
+    for r in rows:
+        yolo = json.loads(r["YOLO_DATA"] or "[]")
+        faces = json.loads(r["DEEPFACE_DATA"] or "[]")
+        photos.append({
+            "metadata": json.loads(r["METADATA"] or "{}"),
+            "yolo_labels": [o["label"] for o in yolo if "label" in o],
+            "dominant_emotions": [f["dominant_emotion"] for f in faces if "dominant_emotion" in f],
+            "id": r["ID"],
+        })
+    return photos
+
+
 def clear_photos(user_id: str) -> None:
     """Delete all photos for a user."""
     try:
@@ -1,27 +1,17 @@
+import os
 import sys
-import uuid
-import json
 import asyncio
+import functools
 import traceback
 import numpy as np
+import orjson
 from fastapi import FastAPI, Request
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 
 from search import find_matches
 
 
-class _NumpyEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, np.floating):
-            return float(o)
-        if isinstance(o, np.integer):
-            return int(o)
-        if isinstance(o, np.ndarray):
-            return o.tolist()
-        return super().default(o)
-
-
 from pathlib import Path
 from contextlib import asynccontextmanager
 
@@ -34,15 +24,16 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
-from config import settings
-
-import snowflake.connector
-from sqlalchemy import create_engine, text
-
-from PIL import Image, ExifTags
+from PIL import Image, ExifTags, ImageOps, UnidentifiedImageError, features
 import pillow_heif
 import io
 
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB, TJSAMP_420
+    _tj = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    _tj = None  # libjpeg-turbo not available — Pillow handles JPEG I/O
+
 from db import (
     init_db,
     insert_photo,
@@ -56,11 +47,15 @@ from db import (
     get_photo_by_id,
     get_untagged_photos,
 )
-from gemini_service import find_matching_labels
 from narration import router as narration_router
 import snowflake_db as sf_db
-from pipeline.objects import detect_objects
-from backend.pipeline.faces import get_face_emotions
+from pipeline.objects import detect_objects, start_object_batcher, stop_object_batcher
+from pipeline.clip_embed import embed_text_async
+from backend.pipeline.faces import (
+    get_face_emotions_async,
+    start_emotion_batcher,
+    stop_emotion_batcher,
+)
 
 # ── Storage ───────────────────────────────────────────────────────────────────
 
@@ -79,10 +74,17 @@ DEMO_USER_ID = "00000000-0000-0000-0000-000000000001"
 async def lifespan(app: FastAPI):
     init_db()
     sf_db.init_schema()
+    if not features.check_feature("libjpeg_turbo"):
+        print("[startup] Pillow is not built against libjpeg-turbo — JPEG uploads will be slower")
+    emotion_batcher = start_emotion_batcher()
+    object_batcher = start_object_batcher()
     yield
+    stop_object_batcher(object_batcher)
+    stop_emotion_batcher(emotion_batcher)
 
 
-app = FastAPI(title="FotoFindr API", lifespan=lifespan)
+# Route results are encoded by orjson rather than the stdlib json module
+app = FastAPI(title="FotoFindr API", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -105,44 +107,22 @@ app.include_router(narration_router)
 
 async def _run_ai_pipeline(
     photo_id: str, image_path: Path, photo_meta: dict | None = None
-) -> None:
+) -> tuple[str, str, dict] | None:
+    """Run YOLO + DeepFace and persist to SQLite. Returns the (photo_id, filename,
+    result) row for the caller to mirror to Snowflake, or None if unreadable."""
+    # Decode once; YOLO and DeepFace both work from the same pixels
     try:
-        image_bytes = image_path.read_bytes()
+        img = await asyncio.to_thread(lambda: Image.open(image_path).convert("RGB"))
     except Exception as e:
         print(f"[pipeline] could not read {image_path}: {e}")
-        return
+        return None
+    img_array = np.asarray(img)
 
     loop = asyncio.get_running_loop()
-
-    yolo_result, deepface_result = await asyncio.gather(
-        detect_objects(image_bytes),
-        loop.run_in_executor(None, get_face_emotions, str(image_path.resolve())),
-        return_exceptions=True,
-    )
-
-    if isinstance(yolo_result, Exception) or yolo_result is None:
-        print(f"[pipeline] yolo failed for {photo_id}: {yolo_result}")
-        yolo_json = "[]"
-    else:
-        yolo_json = json.dumps(
-            [{"label": o.label, "confidence": o.confidence} for o in yolo_result]
-        )
-
-    if isinstance(deepface_result, Exception) or (
-        isinstance(deepface_result, dict) and "error" in deepface_result
-    ):
-        print(f"[pipeline] deepface failed for {photo_id}: {deepface_result}")
-        deepface_json = "[]"
-    else:
-        deepface_json = json.dumps(
-            deepface_result if isinstance(deepface_result, list) else [deepface_result],
-            cls=_NumpyEncoder,
-        )
-
     meta = photo_meta or {}
     result = {
-        "detected_objects": yolo_json,
-        "emotions": deepface_json,
+        "detected_objects": "[]",
+        "emotions": "[]",
         "user_id": meta.get("user_id", ""),
         "caption": meta.get("caption"),
         "tags": meta.get("tags", []),
@@ -151,16 +131,78 @@ async def _run_ai_pipeline(
         "person_ids": meta.get("person_ids", []),
     }
 
-    try:
-        update_photo_pipeline_result(photo_id, result)
-    except Exception as e:
-        print(f"[pipeline] sqlite update failed for {photo_id}: {e}")
+    async def yolo_stage():
+        try:
+            objs = await detect_objects(img)
+        except Exception as e:
+            objs = e
+        if isinstance(objs, Exception) or objs is None:
+            print(f"[pipeline] yolo failed for {photo_id}: {objs}")
+            return "detected_objects", "[]"
+        return "detected_objects", orjson.dumps(
+            [{"label": o.label, "confidence": o.confidence} for o in objs]
+        ).decode()
+
+    async def deepface_stage():
+        try:
+            faces = await get_face_emotions_async(img_array, source=image_path)
+        except Exception as e:
+            faces = e
+        if isinstance(faces, Exception) or (isinstance(faces, dict) and "error" in faces):
+            print(f"[pipeline] deepface failed for {photo_id}: {faces}")
+            return "emotions", "[]"
+        # DeepFace results are full of numpy scalars — orjson encodes them natively
+        return "emotions", orjson.dumps(
+            faces if isinstance(faces, list) else [faces],
+            option=orjson.OPT_SERIALIZE_NUMPY,
+        ).decode()
+
+    # Persist each model's column as soon as it lands instead of waiting on the slower one
+    for next_done in asyncio.as_completed([yolo_stage(), deepface_stage()]):
+        column, value = await next_done
+        result[column] = value
+        try:
+            await loop.run_in_executor(
+                None, functools.partial(update_photo_pipeline_result, photo_id, result, columns={column})
+            )
+        except Exception as e:
+            print(f"[pipeline] sqlite update failed for {photo_id}: {e}")
 
-    filename = meta.get("storage_url", f"/uploads/{photo_id}.jpg")
-    try:
-        await loop.run_in_executor(None, sf_db.upsert_photo, photo_id, filename, result)
-    except Exception as e:
-        print(f"[pipeline] snowflake upsert failed for {photo_id}: {e}")
+    return photo_id, meta.get("storage_url", f"/uploads/{photo_id}.jpg"), result
+
+
+# Photos in flight through YOLO/DeepFace at once during a reprocess. Enough
+# overlap to fill the emotion batcher without oversubscribing the executor.
+MAX_CONCURRENT_PIPELINES = min(8, os.cpu_count() or 4)
+
+# Finished photos mirrored to Snowflake per MERGE — one round-trip per batch
+SF_FLUSH_ROWS = 50
+
+
+async def _run_ai_pipelines_bounded(jobs: list[tuple[str, Path, dict]]) -> None:
+    sem = asyncio.Semaphore(MAX_CONCURRENT_PIPELINES)
+    loop = asyncio.get_running_loop()
+    rows: list[tuple[str, str, dict]] = []
+    flushes: list[asyncio.Future] = []
+
+    def flush() -> None:
+        if rows:
+            flushes.append(loop.run_in_executor(None, sf_db.upsert_photos_bulk, rows.copy()))
+            rows.clear()
+
+    async def gated(job: tuple[str, Path, dict]) -> None:
+        async with sem:
+            row = await _run_ai_pipeline(*job)
+        if row is not None:
+            rows.append(row)
+            if len(rows) >= SF_FLUSH_ROWS:
+                flush()
+
+    await asyncio.gather(*(gated(job) for job in jobs))
+    flush()
+    for result in await asyncio.gather(*flushes, return_exceptions=True):
+        if isinstance(result, Exception):
+            print(f"[pipeline] snowflake bulk upsert failed: {result}")
 
 
 # ── Models ────────────────────────────────────────────────────────────────────
@@ -179,26 +221,110 @@ class NameRequest(BaseModel):
 # ── Routes ────────────────────────────────────────────────────────────────────
 
 
-conn = snowflake.connector.connect(
-    account=settings.snowflake_account.replace("/", "-"),
-    user=settings.snowflake_user,
-    password=settings.snowflake_password,
-    database=settings.snowflake_database,
-    schema=settings.snowflake_schema,
-    warehouse=settings.snowflake_warehouse,
-)
-
-engine = create_engine(
-    f"snowflake://{settings.snowflake_account.replace('/', '-')}.snowflakecomputing.com",
-    creator=lambda: conn,
-)
-
-
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
 
+_PIL_FORMATS = {
+    "image/jpeg": ["JPEG"],
+    "image/png": ["PNG"],
+    "image/webp": ["WEBP"],
+}
+
+
+def _new_photo_id() -> str:
+    """Random id in the same hyphenated 8-4-4-4-12 hex form as str(uuid.uuid4()),
+    straight from os.urandom without building a UUID object."""
+    h = os.urandom(16).hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+def _save_upload_as_jpeg(
+    file: UploadFile, save_path: Path, max_width: int, quality: int
+) -> None:
+    """Decode an upload (HEIC or anything PIL reads), fix orientation, resize and
+    write it as JPEG. CPU-bound and blocking — run it off the event loop."""
+    # Detect HEIC/HEIF and convert
+    if file.content_type in [
+        "image/heic",
+        "image/heif",
+    ] or file.filename.lower().endswith((".heic", ".heif")):
+        heif_file = pillow_heif.read_heif(file.file)
+        img = Image.frombytes(heif_file.mode, heif_file.size, heif_file.data)
+    else:
+        # Lazy — only the header is parsed here. Trust the declared type first
+        # so Pillow doesn't probe every registered decoder; sniff if it lied.
+        try:
+            img = Image.open(file.file, formats=_PIL_FORMATS.get(file.content_type))
+        except UnidentifiedImageError:
+            file.file.seek(0)
+            img = Image.open(file.file)
+
+    exif = img.getexif()
+    exif_raw = img.info.get("exif")
+    if _tj is not None and img.format == "JPEG" and img.mode in ("RGB", "L"):
+        # SIMD decode via libjpeg-turbo; EXIF was read from the header above.
+        # Downscale in the DCT domain by the smallest supported factor that
+        # keeps the (post-rotation) width >= max_width, so the resize below
+        # only has to finish the job on a much smaller image.
+        rotated = exif.get(ExifTags.Base.Orientation) in (5, 6, 7, 8)
+        out_width = img.height if rotated else img.width
+        scale = min(
+            (
+                f
+                for f in _tj.scaling_factors
+                if f[0] <= f[1] and out_width * f[0] / f[1] >= max_width
+            ),
+            key=lambda f: f[0] / f[1],
+            default=(1, 1),
+        )
+        file.file.seek(0)
+        img = Image.fromarray(
+            _tj.decode(file.file.read(), pixel_format=TJPF_RGB, scaling_factor=scale)
+        )
+        if exif_raw:
+            img.info["exif"] = exif_raw  # so exif_transpose below still sees it
+
+    # Fix orientation based on EXIF (all 8 values, in place — no extra copy)
+    try:
+        ImageOps.exif_transpose(img, in_place=True)
+    except Exception:
+        pass
+
+    # Convert to RGB for JPEG
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+
+    # Resize while keeping aspect ratio. BILINEAR is plenty here: the result is
+    # re-encoded at q85 and the models resample again anyway.
+    if img.width > max_width:
+        ratio = max_width / img.width
+        new_height = int(img.height * ratio)
+        img = img.resize((max_width, new_height), Image.Resampling.BILINEAR)
+
+    # Save as JPEG
+    if _tj is not None:
+        save_path.write_bytes(
+            _tj.encode(
+                np.asarray(img),
+                quality=quality,
+                pixel_format=TJPF_RGB,
+                jpeg_subsample=TJSAMP_420,
+            )
+        )
+    else:
+        # Baseline, no extra Huffman-optimization pass, 4:2:0 like the turbo path
+        img.save(
+            save_path,
+            format="JPEG",
+            quality=quality,
+            optimize=False,
+            progressive=False,
+            subsampling=2,
+        )
+
+
 @app.post("/upload/")
 async def upload_photo(
     file: UploadFile = File(...),
@@ -210,66 +336,30 @@ async def upload_photo(
     if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=415, detail="Only image files accepted.")
 
-    file_bytes = await file.read()
-    if len(file_bytes) > 20 * 1024 * 1024:
+    # The upload is already spooled to a temp file — decode straight from it
+    # instead of copying the whole body onto the heap
+    size = file.size if file.size is not None else file.file.seek(0, io.SEEK_END)
+    if size > 20 * 1024 * 1024:
         raise HTTPException(status_code=413, detail="File too large.")
+    file.file.seek(0)
 
-    photo_id = str(uuid.uuid4())
+    photo_id = _new_photo_id()
     save_path = UPLOAD_DIR / f"{photo_id}.jpg"
 
     try:
-        # Detect HEIC/HEIF and convert
-        if file.content_type in [
-            "image/heic",
-            "image/heif",
-        ] or file.filename.lower().endswith((".heic", ".heif")):
-            heif_file = pillow_heif.read_heif(file_bytes)
-            img = Image.frombytes(heif_file.mode, heif_file.size, heif_file.data)
-        else:
-            img = Image.open(io.BytesIO(file_bytes))
-
-        # Fix orientation based on EXIF
-        try:
-            for orientation in ExifTags.TAGS.keys():
-                if ExifTags.TAGS[orientation] == "Orientation":
-                    break
-            exif = img.getexif()
-            if exif is not None:
-                orientation_value = exif.get(orientation)
-                if orientation_value == 3:
-                    img = img.rotate(180, expand=True)
-                elif orientation_value == 6:
-                    img = img.rotate(270, expand=True)
-                elif orientation_value == 8:
-                    img = img.rotate(90, expand=True)
-        except Exception:
-            pass
-
-        # Convert to RGB for JPEG
-        if img.mode != "RGB":
-            img = img.convert("RGB")
-
-        # Resize while keeping aspect ratio
-        if img.width > max_width:
-            ratio = max_width / img.width
-            new_height = int(img.height * ratio)
-            img = img.resize((max_width, new_height), Image.Resampling.LANCZOS)
-
-        # Save as JPEG
-        img.save(save_path, format="JPEG", quality=quality, optimize=True)
-
+        await asyncio.to_thread(_save_upload_as_jpeg, file, save_path, max_width, quality)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Image processing failed: {e}")
 
     storage_url = f"/uploads/{photo_id}.jpg"
-    insert_photo(photo_id, user_id, storage_url)
+    await asyncio.to_thread(insert_photo, photo_id, user_id, storage_url)
 
     return {"photo_id": photo_id, "storage_url": storage_url, "message": "Uploaded."}
 
 
 @app.get("/photos/{user_id}")
 def get_recent_photos(user_id: str, limit: int = 10):
-    return get_all_photos_for_user(user_id)[:limit]
+    return get_all_photos_for_user(user_id, limit=limit)
 
 
 @app.get("/profiles/{user_id}")
@@ -291,20 +381,25 @@ def name_person_endpoint(person_id: str, body: NameRequest):
     return {"ok": True, "person_id": person_id, "name": body.name.strip()}
 
 
-@app.post("/clear/{user_id}")
-async def clear_endpoint(user_id: str):
+def _delete_uploads() -> None:
     for f in UPLOAD_DIR.glob("*.jpg"):
         try:
             f.unlink()
         except Exception:
             pass
 
+
+@app.post("/clear/{user_id}")
+async def clear_endpoint(user_id: str):
+    # One unlink syscall per file — keep the directory walk off the event loop
+    await asyncio.to_thread(_delete_uploads)
+
+    loop = asyncio.get_running_loop()
     try:
-        clear_user_photos(user_id)
+        await loop.run_in_executor(None, clear_user_photos, user_id)
     except Exception as e:
         print(f"[clear] SQLite clear failed: {e}")
 
-    loop = asyncio.get_running_loop()
     try:
         await loop.run_in_executor(None, sf_db.clear_photos, user_id)
     except Exception as e:
@@ -314,70 +409,55 @@ async def clear_endpoint(user_id: str):
 
 
 @app.get("/status/{user_id}")
-async def pipeline_status(user_id: str):
+def pipeline_status(user_id: str):
     return get_pipeline_status(user_id)
 
 
+async def _search_by_embedding(query: str, user_id: str, limit: int) -> list[dict]:
+    """Same photo shape as get_photos_with_labels, plus `similarity`."""
+    try:
+        embedding = await embed_text_async(query)
+    except Exception as e:
+        print(f"[search] CLIP text embedding failed: {e}")
+        return []
+    rows = await asyncio.to_thread(sf_db.search_photos_by_vector, embedding, user_id, None, limit)
+    return [
+        {
+            "metadata": r["metadata"],
+            "yolo_labels": [o["label"] for o in r["detected_objects"] if "label" in o],
+            "dominant_emotions": [
+                f["dominant_emotion"] for f in r["emotions"] if "dominant_emotion" in f
+            ],
+            "id": r["id"],
+            "similarity": r["similarity"],
+        }
+        for r in rows
+    ]
+
+
 @app.post("/search/")
 async def search_photos(req: SearchRequest):
     query = req.query.strip()
     user_id = req.user_id.strip()
+    if not query:
+        # Empty search matches nothing — skip the Snowflake and Gemini round-trips
+        return {"ok": True, "query": query, "matched_labels": [], "photos": []}
 
-    with engine.connect() as conn:
-        result = conn.execute(
-            text("SELECT id, metadata, yolo_data, deepface_data FROM PHOTOS")
-        ).fetchall()
-
-    photos = []
-    all_objects = set()
-    all_emotions = set()
-
-    for row in result:
-        # Metadata
-        try:
-            meta = json.loads(row.metadata)
-        except (TypeError, json.JSONDecodeError):
-            meta = {}
-
-        # YOLO labels
-        try:
-            yolo_objs = json.loads(row.yolo_data)
-            yolo_labels = [obj["label"] for obj in yolo_objs]
-        except (TypeError, json.JSONDecodeError, KeyError):
-            yolo_labels = []
-
-        # DeepFace emotions
-        try:
-            df_objs = json.loads(row.deepface_data)
-            dominant_emotions = [
-                obj["dominant_emotion"] for obj in df_objs if "dominant_emotion" in obj
-            ]
-        except (TypeError, json.JSONDecodeError, KeyError):
-            dominant_emotions = []
-
-        # Collect all objects and emotions seen so far
-        all_objects.update(yolo_labels)
-        all_emotions.update(dominant_emotions)
-
-        photos.append(
-            {
-                "metadata": meta,
-                "yolo_labels": yolo_labels,
-                "dominant_emotions": dominant_emotions,
-                "id": row.id,
-            }
-        )
+    # 1️⃣ Collect the distinct labels — only those leave Snowflake, no per-row JSON decoding
+    all_objects, all_emotions = await asyncio.to_thread(sf_db.get_distinct_labels, user_id)
 
     # 2️⃣ Ask Gemini which objects/emotions match query
-    matched_labels = find_matches(query, list(all_objects), list(all_emotions))
+    matched_labels = await asyncio.to_thread(find_matches, query, all_objects, all_emotions)
     print("matched labels by gemini are:", matched_labels)
 
-    # 3️⃣ Filter photos: keep those that have at least one matching label
-    filtered_photos = []
-    for photo in photos:
-        labels_in_photo = set(photo["yolo_labels"] + photo["dominant_emotions"])
-        if labels_in_photo & set(matched_labels):
-            filtered_photos.append(photo)
+    # 3️⃣ Fetch only the photos that have at least one matching label
+    if matched_labels:
+        filtered_photos = await asyncio.to_thread(
+            sf_db.get_photos_with_labels, user_id, matched_labels
+        )
+    else:
+        # No label fits — rank by CLIP similarity on the warehouse instead
+        filtered_photos = await _search_by_embedding(query, user_id, req.limit)
 
     return {
         "ok": True,
@@ -412,13 +492,14 @@ def untagged_photos(user_id: str):
 
 @app.post("/reprocess/{user_id}")
 async def reprocess_all(user_id: str, background_tasks: BackgroundTasks):
-    photos = get_all_photos_for_user(user_id)
-    queued = 0
+    photos = await asyncio.to_thread(get_all_photos_for_user, user_id, limit=None)
+    jobs = []
     for photo in photos:
         image_path = UPLOAD_DIR / f"{photo['id']}.jpg"
         if image_path.exists():
-            background_tasks.add_task(_run_ai_pipeline, photo["id"], image_path, photo)
-            queued += 1
+            jobs.append((photo["id"], image_path, photo))
+    background_tasks.add_task(_run_ai_pipelines_bounded, jobs)
+    queued = len(jobs)
     print(f"[reprocess] Queued {queued}/{len(photos)} photos for user {user_id}")
     return {"queued": queued, "total": len(photos)}
 
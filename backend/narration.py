@@ -1,13 +1,14 @@
-import os
 import sys
 from pathlib import Path
 import requests
+from requests.adapters import HTTPAdapter
 from fastapi import APIRouter, Form, HTTPException
 
 _project_root = Path(__file__).resolve().parent.parent
 if str(_project_root) not in sys.path:
     sys.path.insert(0, str(_project_root))
 
+from config import settings
 from db import get_photo_by_id
 from gemini_service import generate_description
 
@@ -15,6 +16,12 @@ router = APIRouter()
 UPLOAD_DIR = Path("uploads")
 NARRATION_DIR = Path("uploads/narrations")
 
+# One keep-alive session for every narration — skips a TCP+TLS handshake to
+# api.elevenlabs.io per request. Safe to share across the threadpool.
+_ELEVENLABS_URL = "https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+_elevenlabs = requests.Session()
+_elevenlabs.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=16))
+
 
 @router.post("/narrate/")
 def narrate_photo(photo_id: str = Form(...), user_id: str = Form(...)):
@@ -39,23 +46,25 @@ def narrate_photo(photo_id: str = Form(...), user_id: str = Form(...)):
 
         # 4. Generate audio via ElevenLabs
         voice_id = "EXAVITQu4vr4xnSDxMaL"
-        url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+        url = _ELEVENLABS_URL.format(voice_id=voice_id)
         audio_filename = f"{photo_id}_narrate.mp3"
         audio_path = NARRATION_DIR / audio_filename
 
-        headers = {"xi-api-key": os.environ.get("ELEVENLABS_API_KEY", "")}
+        headers = {"xi-api-key": settings.elevenlabs_api_key}
         payload = {
             "text": description,
             "model_id": "eleven_multilingual_v2",
             "voice_settings": {"stability": 0.5, "similarity_boost": 0.5},
         }
 
-        r = requests.post(url, headers=headers, json=payload)
-        if r.status_code != 200:
-            print(f"[narrate] ElevenLabs failed {r.status_code}: {r.text[:200]}")
-            raise HTTPException(status_code=502, detail=f"ElevenLabs failed: {r.text[:200]}")
-
-        audio_path.write_bytes(r.content)
+        # Stream the audio straight to disk as it downloads
+        with _elevenlabs.post(url, headers=headers, json=payload, stream=True, timeout=30) as r:
+            if r.status_code != 200:
+                print(f"[narrate] ElevenLabs failed {r.status_code}: {r.text[:200]}")
+                raise HTTPException(status_code=502, detail=f"ElevenLabs failed: {r.text[:200]}")
+            with audio_path.open("wb") as f:
+                for chunk in r.iter_content(chunk_size=64 * 1024):
+                    f.write(chunk)
 
         return {
             "description": description,
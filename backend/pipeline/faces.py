@@ -1,12 +1,39 @@
-def get_face_emotions(image_path: str):
+import asyncio
+import io
+from functools import lru_cache
+from pathlib import Path
+
+from config import settings
+from pipeline.executor import MODEL_POOL
+
+# Output order of DeepFace's emotion model
+EMOTION_LABELS = ("angry", "disgust", "fear", "happy", "sad", "surprise", "neutral")
+
+# Micro-batching: photos arriving within BATCH_WINDOW_S share one emotion forward pass
+MAX_BATCH = 16
+BATCH_WINDOW_S = 0.02
+
+_queue: asyncio.Queue | None = None
+
+
+def _load_rgb(image):
+    """A path is decoded here; an already-decoded RGB array is used as-is."""
+    import numpy as np
+    from PIL import Image
+
+    if isinstance(image, np.ndarray):
+        return image
+    # Pre-load with PIL → numpy to bypass DeepFace's internal OpenCV file reader,
+    # which can fail on Windows paths or certain JPEG variants.
+    return np.array(Image.open(image).convert("RGB"))
+
+
+def get_face_emotions(image):
+    """`image` is a file path or an RGB ndarray."""
     try:
-        import numpy as np
-        from PIL import Image
         from deepface import DeepFace  # lazy import — keeps server bootable if dep is broken
 
-        # Pre-load with PIL → numpy to bypass DeepFace's internal OpenCV file reader,
-        # which can fail on Windows paths or certain JPEG variants.
-        img_array = np.array(Image.open(image_path).convert("RGB"))
+        img_array = _load_rgb(image)
 
         results = DeepFace.analyze(
             img_path=img_array,
@@ -17,4 +44,165 @@ def get_face_emotions(image_path: str):
         )
         return results
     except Exception as e:
-        return {"error": str(e)}
\ No newline at end of file
+        return {"error": str(e)}
+
+
+def _extract_faces(image) -> list[dict]:
+    """Detection + alignment only, same settings as get_face_emotions."""
+    from deepface import DeepFace
+
+    return DeepFace.extract_faces(
+        img_path=_load_rgb(image),
+        detector_backend='retinaface',
+        align=True,
+        expand_percentage=10,
+    )
+
+
+@lru_cache(maxsize=1)
+def _emotion_net():
+    from deepface import DeepFace
+
+    try:
+        client = DeepFace.build_model(task="facial_attribute", model_name="Emotion")
+    except TypeError:  # deepface < 0.0.93
+        client = DeepFace.build_model("Emotion")
+    return getattr(client, "model", client)  # the underlying keras model
+
+
+def _pad_square(crop, size: int = 224):
+    """DeepFace's own face preprocessing: fit inside size x size keeping the
+    aspect ratio, then zero-pad the rest, so the 48x48 input isn't stretched."""
+    import cv2
+    import numpy as np
+
+    crop = np.asarray(crop, dtype=np.float32)
+    h, w = crop.shape[:2]
+    factor = min(size / h, size / w)
+    crop = cv2.resize(crop, (max(1, int(w * factor)), max(1, int(h * factor))))
+    dh, dw = size - crop.shape[0], size - crop.shape[1]
+    return np.pad(crop, ((dh // 2, dh - dh // 2), (dw // 2, dw - dw // 2), (0, 0)))
+
+
+def _predict_emotions(crops: list):
+    """One forward pass over every face crop — (N, 7) probabilities."""
+    import cv2
+    import numpy as np
+
+    batch = np.stack([
+        cv2.resize(cv2.cvtColor(_pad_square(crop), cv2.COLOR_RGB2GRAY), (48, 48))
+        for crop in crops
+    ])[..., None]
+    return _emotion_net().predict(batch, batch_size=len(crops), verbose=0)
+
+
+def _emotion_result(face: dict, probs) -> dict:
+    """Shape one face like an entry of DeepFace.analyze's output."""
+    scores = probs * 100 / probs.sum()
+    emotion = {label: float(score) for label, score in zip(EMOTION_LABELS, scores)}
+    return {
+        "emotion": emotion,
+        "dominant_emotion": max(emotion, key=emotion.get),
+        "region": face.get("facial_area", {}),
+        "face_confidence": face.get("confidence"),
+    }
+
+
+def _fail(pending: list, exc: BaseException) -> None:
+    for fut, _ in pending:
+        if not fut.done():
+            fut.set_exception(exc)
+
+
+async def _emotion_batcher(queue: asyncio.Queue) -> None:
+    loop = asyncio.get_running_loop()
+    pending: list = []
+    try:
+        while True:
+            pending = [await queue.get()]
+            deadline = loop.time() + BATCH_WINDOW_S
+            while len(pending) < MAX_BATCH:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            crops = [crop for _, photo_crops in pending for crop in photo_crops]
+            try:
+                probs = await loop.run_in_executor(MODEL_POOL, _predict_emotions, crops)
+            except Exception as e:
+                _fail(pending, e)
+                continue
+
+            start = 0
+            for fut, photo_crops in pending:
+                end = start + len(photo_crops)
+                if not fut.done():
+                    fut.set_result(probs[start:end])
+                start = end
+    except asyncio.CancelledError:
+        # Stopped mid-batch — its callers would otherwise await forever
+        _fail(pending, RuntimeError("emotion batcher stopped"))
+        raise
+
+
+def start_emotion_batcher() -> asyncio.Task:
+    """Start the batching loop on the running event loop (call from the app lifespan)."""
+    global _queue
+    _queue = asyncio.Queue()
+    return asyncio.create_task(_emotion_batcher(_queue))
+
+
+def stop_emotion_batcher(task: asyncio.Task) -> None:
+    """Stop the loop and fail every queued request, so no caller awaits forever."""
+    global _queue
+    queue, _queue = _queue, None
+    while queue is not None and not queue.empty():
+        _fail([queue.get_nowait()], RuntimeError("emotion batcher stopped"))
+    task.cancel()
+
+
+async def _face_emotions_modal(image, source: Path | str | None) -> list[dict]:
+    from backend.pipeline.modal_app import predict_remote
+
+    if source is None and not hasattr(image, "shape"):
+        source = image
+    if source is not None:
+        image_bytes = await asyncio.to_thread(Path(source).read_bytes)
+    else:
+        from PIL import Image
+
+        buf = io.BytesIO()
+        Image.fromarray(image).save(buf, format="JPEG", quality=95)
+        image_bytes = buf.getvalue()
+    return (await predict_remote(image_bytes))["faces"]
+
+
+async def get_face_emotions_async(image, source: Path | str | None = None):
+    """get_face_emotions with the emotion head batched across concurrent photos.
+    Falls back to the per-image DeepFace.analyze path if the batcher isn't running.
+
+    With MODAL_VISION set, the whole thing runs on the deployed Modal class
+    instead; `source` is the encoded file behind `image`, sent as-is."""
+    if settings.modal_vision:
+        try:
+            return await _face_emotions_modal(image, source)
+        except Exception as e:
+            print(f"[faces] Modal failed, running locally: {e}")
+
+    loop = asyncio.get_running_loop()
+    if _queue is None:
+        return await loop.run_in_executor(MODEL_POOL, get_face_emotions, image)
+    try:
+        faces = await loop.run_in_executor(MODEL_POOL, _extract_faces, image)
+        if not faces:
+            return []
+        fut = loop.create_future()
+        await _queue.put((fut, [face["face"] for face in faces]))
+        probs = await fut
+    except Exception as e:
+        return {"error": str(e)}
+    return [_emotion_result(face, p) for face, p in zip(faces, probs)]
@@ -1,41 +1,161 @@
 import modal
 import io
+import os
 
 # 1. Define the shared environment
 app = modal.App("fotofindr-vision-service")
 
-# Include all requirements for both DeepFace and YOLO
+
+def _download_weights():
+    """Runs at image build time, so cold containers load weights from the
+    image instead of downloading them first."""
+    import open_clip
+    from deepface import DeepFace
+
+    open_clip.create_model_and_transforms("ViT-B-32", pretrained="openai")
+    try:
+        DeepFace.build_model(task="facial_attribute", model_name="Emotion")
+        DeepFace.build_model(task="face_detector", model_name="retinaface")
+    except TypeError:  # deepface < 0.0.93
+        DeepFace.build_model("Emotion")
+
+
+# Include all requirements for DeepFace, YOLO and CLIP
 image = (modal.Image.debian_slim()
     .pip_install(
-        "deepface", "tf-keras", "tensorflow", 
-        "opencv-python-headless", "ultralytics" # YOLO dep
+        "deepface", "tf-keras", "tensorflow",
+        "opencv-python-headless", "ultralytics", # YOLO dep
+        "open_clip_torch", "pillow",
     )
+    .run_function(_download_weights)
 )
 
-@app.function(image=image, gpu="L4")
-def process_vision_pipeline(image_bytes: bytes):
-    from deepface import DeepFace
-    from ultralytics import YOLO
-    import tempfile
-    
-    # Save bytes to a temp file because DeepFace/YOLO prefer file paths
-    with tempfile.NamedTemporaryFile(suffix=".jpg") as tmp:
-        tmp.write(image_bytes)
-        tmp.flush()
-        
-        # --- YOUR PART (DeepFace) ---
-        face_results = DeepFace.analyze(
-            img_path=tmp.name, 
-            actions=['emotion'],
-            detector_backend='retinaface',
-            enforce_detection=False
+# Containers kept up even when idle. 0 (scale to zero) by default; set
+# MODAL_MIN_CONTAINERS=1 at deploy time to skip cold starts for a session's
+# first photo, at the cost of an always-on GPU.
+MIN_CONTAINERS = int(os.environ.get("MODAL_MIN_CONTAINERS", "0"))
+
+# Output order of DeepFace's emotion model (same as backend/pipeline/faces.py)
+EMOTION_LABELS = ("angry", "disgust", "fear", "happy", "sad", "surprise", "neutral")
+
+
+def _pad_square(crop, size: int = 224):
+    """Same as backend/pipeline/faces.py: DeepFace's aspect-preserving
+    resize + zero pad, so batched emotions match DeepFace.analyze."""
+    import cv2
+    import numpy as np
+
+    crop = np.asarray(crop, dtype=np.float32)
+    h, w = crop.shape[:2]
+    factor = min(size / h, size / w)
+    crop = cv2.resize(crop, (max(1, int(w * factor)), max(1, int(h * factor))))
+    dh, dw = size - crop.shape[0], size - crop.shape[1]
+    return np.pad(crop, ((dh // 2, dh - dh // 2), (dw // 2, dw - dw // 2), (0, 0)))
+
+
+@app.cls(image=image, gpu="L4", scaledown_window=300, min_containers=MIN_CONTAINERS)
+class VisionPipeline:
+    @modal.enter()
+    def load(self):
+        """Runs once per container — warm calls skip every model load."""
+        import open_clip
+        from deepface import DeepFace
+
+        try:
+            client = DeepFace.build_model(task="facial_attribute", model_name="Emotion")
+        except TypeError:  # deepface < 0.0.93
+            client = DeepFace.build_model("Emotion")
+        self.emotion = getattr(client, "model", client)  # the underlying keras model
+        # Populates DeepFace's model cache, so extract_faces reuses this RetinaFace
+        try:
+            DeepFace.build_model(task="face_detector", model_name="retinaface")
+        except TypeError:
+            pass  # older deepface builds the detector lazily on first use
+
+        # Same weights as pipeline/clip_embed.py — image vectors must share the
+        # embedding space of the text queries encoded on the host.
+        model, _, self.preprocess = open_clip.create_model_and_transforms(
+            "ViT-B-32", pretrained="openai"
         )
+        self.clip = model.to("cuda").eval()
+
+    def _embed_images(self, images: list) -> list[list[float]]:
+        """One batched CLIP forward pass, L2-normalized like clip_embed.embed_image."""
+        import torch
+
+        batch = torch.stack([self.preprocess(img) for img in images]).to("cuda", non_blocking=True)
+        with torch.inference_mode(), torch.autocast("cuda", dtype=torch.bfloat16):
+            feats = self.clip.encode_image(batch)
+        feats = feats.float()
+        feats = feats / feats.norm(dim=-1, keepdim=True)
+        return feats.cpu().numpy().tolist()
+
+    def _emotions(self, images: list) -> list[list[dict]]:
+        """RetinaFace per image (sizes differ), then one emotion forward pass
+        over every face crop in the batch. Entries match DeepFace.analyze's."""
+        import cv2
+        import numpy as np
+        from deepface import DeepFace
+
+        faces = [
+            DeepFace.extract_faces(
+                img_path=np.asarray(img),
+                detector_backend='retinaface',
+                enforce_detection=False,
+            )
+            for img in images
+        ]
+        crops = [face["face"] for img_faces in faces for face in img_faces]
+        if not crops:
+            return [[] for _ in images]
+        batch = np.stack([
+            cv2.resize(cv2.cvtColor(_pad_square(crop), cv2.COLOR_RGB2GRAY), (48, 48))
+            for crop in crops
+        ])[..., None]
+        probs = self.emotion.predict(batch, batch_size=len(crops), verbose=0)
+
+        results, start = [], 0
+        for img_faces in faces:
+            img_results = []
+            for face, p in zip(img_faces, probs[start:start + len(img_faces)]):
+                scores = p * 100 / p.sum()
+                emotion = {label: float(score) for label, score in zip(EMOTION_LABELS, scores)}
+                img_results.append({
+                    "emotion": emotion,
+                    "dominant_emotion": max(emotion, key=emotion.get),
+                    "region": face.get("facial_area", {}),
+                    "face_confidence": face.get("confidence"),
+                })
+            results.append(img_results)
+            start += len(img_faces)
+        return results
+
+    @modal.batched(max_batch_size=8, wait_ms=50)
+    def predict(self, image_bytes_list: list[bytes]) -> list[dict]:
+        """Callers send one image per call; Modal groups concurrent calls
+        into `image_bytes_list` and hands each caller its own dict back."""
+        from PIL import Image
+
+        images = [Image.open(io.BytesIO(b)).convert("RGB") for b in image_bytes_list]
+        embeddings = self._embed_images(images)
+        faces = self._emotions(images)
 
         # --- TEAMMATE'S PART (YOLO) ---
-        # model = YOLO("yolov8n.pt") 
-        # object_results = model(tmp.name)
-        
-        return {
-            "faces": face_results,
-            "objects": [] # This is where the YOLO dev will plug in their data
-        }
\ No newline at end of file
+        # model = YOLO("yolov8n.pt")
+        # object_results = model(images)
+
+        return [
+            {
+                "faces": img_faces,
+                "objects": [], # This is where the YOLO dev will plug in their data
+                "embedding": embedding,
+            }
+            for img_faces, embedding in zip(faces, embeddings)
+        ]
+
+
+async def predict_remote(image_bytes: bytes) -> dict:
+    """Host side: run one image through the deployed VisionPipeline
+    (`modal deploy backend/pipeline/modal_app.py`)."""
+    pipeline = modal.Cls.from_name(app.name, "VisionPipeline")
+    return await pipeline().predict.remote.aio(image_bytes)
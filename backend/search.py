@@ -1,5 +1,8 @@
 import os
-import ast
+import json
+from functools import lru_cache
+
+import numpy as np
 from google import genai
 from google.genai import types
 from dotenv import load_dotenv
@@ -10,15 +13,33 @@ load_dotenv()
 client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
 
 
-def find_matches(query: str, objects: list[str], emotions: list[str]) -> list[str]:
-    """
-    Given a query, list of objects, and list of emotions,
-    return only those elements that match the query.
-    """
-    prompt = f"""
+# Above this many candidates, only the CLIP-nearest labels are sent to Gemini
+SHORTLIST_SIZE = 32
+
+
+def _shortlist(query: str, labels: tuple[str, ...]) -> tuple[str, ...]:
+    """Keep the labels closest to the query in CLIP text space.
+    Label embeddings are memoised by embed_text, so only new labels hit the encoder."""
+    if len(labels) <= SHORTLIST_SIZE:
+        return labels
+    try:
+        from pipeline.clip_embed import embed_text
+
+        label_embs = np.array([embed_text(label) for label in labels], dtype=np.float32)
+        query_emb = np.asarray(embed_text(query), dtype=np.float32)
+    except Exception as e:
+        print(f"[search] label shortlist unavailable, sending all labels: {e}")
+        return labels
+    scores = label_embs @ query_emb
+    keep = np.argpartition(-scores, SHORTLIST_SIZE - 1)[:SHORTLIST_SIZE]
+    return tuple(labels[i] for i in sorted(keep))
+
+
+# Static scaffold, built once — only the query and the two label lists vary
+_PROMPT = """
 You are a classifier.
 
-User query: "{query}"
+User query: {query}
 
 Available YOLO objects:
 {objects}
@@ -26,7 +47,7 @@ Available YOLO objects:
 Available emotions:
 {emotions}
 
-Return ONLY a Python list of elements from the sets that match the query.
+Return the elements from the sets that match the query.
 
 Example:
 Query: "Pictures of a scared bird"
@@ -36,27 +57,69 @@ Output:
 ["bird","fear"]
 """
 
+# Structured output — response.text is guaranteed to be a JSON list of strings
+_CONFIG = types.GenerateContentConfig(
+    max_output_tokens=512,
+    response_mime_type="application/json",
+    response_schema=list[str],
+)
+
+
+def find_matches(query: str, objects: list[str], emotions: list[str]) -> list[str]:
+    """
+    Given a query, list of objects, and list of emotions,
+    return only those elements that match the query.
+    """
+    query = " ".join(query.lower().split())
+    if not query or not (objects or emotions):
+        return []  # nothing to match — skip the Gemini call
+    # Normalized key: users re-running or refining a search against the same
+    # label catalog get the previous answer without another Gemini round-trip.
+    try:
+        matches = _find_matches_cached(
+            query,
+            tuple(sorted(set(objects))),
+            tuple(sorted(set(emotions))),
+        )
+    except _UnparsableResponse:
+        return []  # not cached — the same query asks Gemini again next time
+    return list(matches)
+
+
+class _UnparsableResponse(Exception):
+    """Raised out of _find_matches_cached so lru_cache doesn't keep the miss."""
+
+
+@lru_cache(maxsize=1024)
+def _find_matches_cached(
+    query: str, objects: tuple[str, ...], emotions: tuple[str, ...]
+) -> tuple[str, ...]:
+    # Inside the cache: a repeated query skips the CLIP pass as well as Gemini
+    objects = _shortlist(query, objects)
+    emotions = _shortlist(query, emotions)
+    prompt = _PROMPT.format(
+        query=json.dumps(query),
+        objects=json.dumps(list(objects)),
+        emotions=json.dumps(list(emotions)),
+    )
+
     # Call the new SDK
     response = client.models.generate_content(
         model="gemini-2.5-flash",
         contents=prompt,
-        # You can optionally adjust config (e.g., temperature) here
-        config=types.GenerateContentConfig(max_output_tokens=512),
+        config=_CONFIG,
     )
 
-    text = response.text.strip()
-
-    # Safely parse a Python literal (list)
     try:
-        matches = ast.literal_eval(text)
-        if not isinstance(matches, list) or not all(
-            isinstance(x, str) for x in matches
-        ):
-            matches = []
-    except Exception:
-        matches = []
-
-    return matches
+        matches = json.loads(response.text)
+    except Exception as e:  # empty/None/truncated text
+        raise _UnparsableResponse from e
+    if not isinstance(matches, list) or not all(
+        isinstance(x, str) for x in matches
+    ):
+        raise _UnparsableResponse
+
+    return tuple(matches)
 
 
 # Example usage
@@ -5,27 +5,50 @@ Table schema (already created in Snowflake):
   ID           VARCHAR   — UUID
   FILENAME     VARCHAR   — original device URI (ph://, content://, etc.)
   CREATED_AT   TIMESTAMP — auto-set on insert
-  METADATA     VARIANT   — caption, tags, embedding, importance_score, user_id, …
+  METADATA     VARIANT   — caption, tags, importance_score, user_id, …
   YOLO_DATA    VARIANT   — YOLO detected objects list
   DEEPFACE_DATA VARIANT  — emotion / face data list
+  EMBEDDING    VECTOR(FLOAT, 512) — CLIP image embedding (added by init_schema)
 
 All functions are synchronous (snowflake-connector-python is sync).
 Call them via BackgroundTasks or asyncio.to_thread to avoid blocking.
 """
 
-import json
+import queue
+from contextlib import contextmanager
+from typing import Iterator, Optional
 
+import orjson
 import snowflake.connector
 
 from config import settings
 
+EMBEDDING_DIM = 512  # CLIP ViT-B-32
+
+
+def _dumps(value) -> str:
+    """orjson-encode a bind parameter (numpy arrays/scalars included)."""
+    return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+
+# Bind a JSON float array as a native VECTOR (NULL stays NULL)
+_VECTOR_BIND = f"PARSE_JSON(%s)::ARRAY::VECTOR(FLOAT, {EMBEDDING_DIM})"
+
 
 # ---------------------------------------------------------------------------
 # Connection
 # ---------------------------------------------------------------------------
 
+# Idle connections ready for reuse. Opening one costs a TLS handshake + auth
+# (hundreds of ms), so helpers check one out instead of connecting per call.
+# Sized for several concurrent /search/ requests (two short queries each).
+_POOL_SIZE = 8
+_pool: "queue.LifoQueue[snowflake.connector.SnowflakeConnection]" = queue.LifoQueue(
+    maxsize=_POOL_SIZE
+)
+
 
-def _get_conn() -> snowflake.connector.SnowflakeConnection:
+def _connect() -> snowflake.connector.SnowflakeConnection:
     account = settings.snowflake_account.replace("/", "-")
     return snowflake.connector.connect(
         account=account,
@@ -34,14 +57,44 @@ def _get_conn() -> snowflake.connector.SnowflakeConnection:
         database=settings.snowflake_database,
         schema=settings.snowflake_schema,
         warehouse=settings.snowflake_warehouse,
+        client_session_keep_alive=True,
     )
 
 
+@contextmanager
+def _get_conn() -> Iterator[snowflake.connector.SnowflakeConnection]:
+    """Check a connection out of the pool, returning it when the block exits."""
+    conn = None
+    while conn is None:
+        try:
+            conn = _pool.get_nowait()
+        except queue.Empty:
+            conn = _connect()
+            break
+        if conn.is_closed():
+            conn = None
+
+    try:
+        yield conn
+    except Exception:
+        conn.close()  # don't recycle a connection in an unknown state
+        raise
+
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+
 def init_schema() -> None:
-    """Verify Snowflake connectivity on startup. Table already exists."""
+    """Verify Snowflake connectivity on startup and add the EMBEDDING column."""
     try:
         with _get_conn() as conn:
-            conn.cursor().execute("SELECT CURRENT_TIMESTAMP()")
+            cur = conn.cursor()
+            cur.execute("SELECT CURRENT_TIMESTAMP()")
+            cur.execute(
+                f"ALTER TABLE photos ADD COLUMN IF NOT EXISTS EMBEDDING VECTOR(FLOAT, {EMBEDDING_DIM})"
+            )
         print("[snowflake] Connected.")
     except Exception as e:
         print(f"[snowflake] Connection check failed (non-fatal): {e}")
@@ -59,7 +112,7 @@ def insert_photo(photo_id: str, device_uri: str, user_id: str) -> None:
     YOLO_DATA and DEEPFACE_DATA are filled in by update_photo_pipeline_result.
     """
     try:
-        metadata = json.dumps({"user_id": user_id})
+        metadata = _dumps({"user_id": user_id})
         with _get_conn() as conn:
             conn.cursor().execute(
                 """
@@ -73,13 +126,32 @@ def insert_photo(photo_id: str, device_uri: str, user_id: str) -> None:
         print(f"[snowflake] insert_photo failed: {e}")
 
 
+# One MERGE instead of UPDATE → check rowcount → INSERT: a single round-trip,
+# and the read-modify-write is atomic inside Snowflake.
+_UPSERT_PHOTO_SQL = """
+MERGE INTO photos t
+USING (
+    SELECT %s AS id, %s AS filename,
+           PARSE_JSON(%s) AS metadata, PARSE_JSON(%s) AS yolo, PARSE_JSON(%s) AS deepface
+) s
+ON t.ID = s.id
+WHEN MATCHED THEN UPDATE SET
+    METADATA      = s.metadata,
+    YOLO_DATA     = s.yolo,
+    DEEPFACE_DATA = s.deepface
+WHEN NOT MATCHED THEN
+    INSERT (ID, FILENAME, CREATED_AT, METADATA, YOLO_DATA, DEEPFACE_DATA)
+    VALUES (s.id, s.filename, CURRENT_TIMESTAMP(), s.metadata, s.yolo, s.deepface)
+"""
+
+
 def upsert_photo(photo_id: str, filename: str, result: dict) -> None:
     """
-    UPDATE the row if it exists, INSERT if it doesn't.
+    UPDATE the row if it exists, INSERT if it doesn't (one MERGE).
     Carries all metadata (user_id, caption, tags, …) plus YOLO and DeepFace data.
     """
     try:
-        metadata = json.dumps(
+        metadata = _dumps(
             {
                 "user_id": result.get("user_id", ""),
                 "caption": result.get("caption"),
@@ -93,26 +165,9 @@ def upsert_photo(photo_id: str, filename: str, result: dict) -> None:
         deepface_raw = result.get("emotions", "[]")
 
         with _get_conn() as conn:
-            cur = conn.cursor()
-            cur.execute(
-                """
-                UPDATE photos SET
-                    METADATA      = PARSE_JSON(%s),
-                    YOLO_DATA     = PARSE_JSON(%s),
-                    DEEPFACE_DATA = PARSE_JSON(%s)
-                WHERE ID = %s
-                """,
-                (metadata, yolo_raw, deepface_raw, photo_id),
+            conn.cursor().execute(
+                _UPSERT_PHOTO_SQL, (photo_id, filename, metadata, yolo_raw, deepface_raw)
             )
-            if cur.rowcount == 0:
-                # Row didn't exist yet — insert it
-                cur.execute(
-                    """
-                    INSERT INTO photos (ID, FILENAME, CREATED_AT, METADATA, YOLO_DATA, DEEPFACE_DATA)
-                    SELECT %s, %s, CURRENT_TIMESTAMP(), PARSE_JSON(%s), PARSE_JSON(%s), PARSE_JSON(%s)
-                    """,
-                    (photo_id, filename, metadata, yolo_raw, deepface_raw),
-                )
         print(f"[snowflake] upsert_photo ok: {photo_id}")
     except Exception as e:
         print(f"[snowflake] upsert_photo failed: {e}")
@@ -121,21 +176,14 @@ def upsert_photo(photo_id: str, filename: str, result: dict) -> None:
 def update_photo_pipeline_result(photo_id: str, result: dict) -> None:
     """
     After AI pipeline finishes, push:
-      METADATA    ← caption, tags, embedding, importance_score, user_id, low_value_flags
+      METADATA    ← caption, tags, importance_score, user_id, low_value_flags
       YOLO_DATA   ← detected objects from YOLO
       DEEPFACE_DATA ← emotion / face data
+      EMBEDDING   ← CLIP embedding as a native VECTOR
     """
     try:
-        # Build METADATA: everything except YOLO and emotion data
-        metadata = {
-            "user_id": result.get("user_id", ""),
-            "caption": result.get("caption"),
-            "tags": result.get("tags", []),
-            "importance_score": result.get("importance_score", 1.0),
-            "low_value_flags": result.get("low_value_flags", []),
-            "person_ids": result.get("person_ids", []),
-            "embedding": result.get("embedding"),
-        }
+        metadata = _pipeline_metadata(result)
+        embedding = result.get("embedding")
 
         # detected_objects is already a JSON string from runner.py
         yolo_raw = result.get("detected_objects", "[]")
@@ -145,19 +193,233 @@ def update_photo_pipeline_result(photo_id: str, result: dict) -> None:
 
         with _get_conn() as conn:
             conn.cursor().execute(
-                """
+                f"""
                 UPDATE photos SET
                     METADATA      = PARSE_JSON(%s),
                     YOLO_DATA     = PARSE_JSON(%s),
-                    DEEPFACE_DATA = PARSE_JSON(%s)
+                    DEEPFACE_DATA = PARSE_JSON(%s),
+                    EMBEDDING     = {_VECTOR_BIND}
                 WHERE ID = %s
                 """,
-                (json.dumps(metadata), yolo_raw, deepface_raw, photo_id),
+                (
+                    metadata,
+                    yolo_raw,
+                    deepface_raw,
+                    _dumps(embedding) if embedding is not None and len(embedding) else None,
+                    photo_id,
+                ),
             )
     except Exception as e:
         print(f"[snowflake] update_photo failed (non-fatal): {e}")
 
 
+def _pipeline_metadata(result: dict) -> str:
+    """METADATA JSON: everything except YOLO, emotion and embedding data."""
+    return _dumps(
+        {
+            "user_id": result.get("user_id", ""),
+            "caption": result.get("caption"),
+            "tags": result.get("tags", []),
+            "importance_score": result.get("importance_score", 1.0),
+            "low_value_flags": result.get("low_value_flags", []),
+            "person_ids": result.get("person_ids", []),
+        }
+    )
+
+
+# Rows per multi-row statement — keeps each one well under the bind limit.
+_BULK_CHUNK = 500
+
+
+def upsert_photos_bulk(items: list[tuple[str, str, dict]]) -> None:
+    """
+    upsert_photo for many (photo_id, filename, result) rows — one MERGE over a
+    multi-row VALUES list per chunk instead of a round-trip per photo.
+    """
+    try:
+        with _get_conn() as conn:
+            cur = conn.cursor()
+            for i in range(0, len(items), _BULK_CHUNK):
+                chunk = items[i : i + _BULK_CHUNK]
+                params = []
+                for photo_id, filename, result in chunk:
+                    params += [
+                        photo_id,
+                        filename,
+                        _pipeline_metadata(result),
+                        result.get("detected_objects", "[]"),
+                        result.get("emotions", "[]"),
+                    ]
+                cur.execute(
+                    f"""
+                    MERGE INTO photos t
+                    USING (
+                        SELECT column1 AS id, column2 AS filename, PARSE_JSON(column3) AS metadata,
+                               PARSE_JSON(column4) AS yolo, PARSE_JSON(column5) AS deepface
+                        FROM VALUES {", ".join(["(%s, %s, %s, %s, %s)"] * len(chunk))}
+                    ) s
+                    ON t.ID = s.id
+                    WHEN MATCHED THEN UPDATE SET
+                        METADATA      = s.metadata,
+                        YOLO_DATA     = s.yolo,
+                        DEEPFACE_DATA = s.deepface
+                    WHEN NOT MATCHED THEN
+                        INSERT (ID, FILENAME, CREATED_AT, METADATA, YOLO_DATA, DEEPFACE_DATA)
+                        VALUES (s.id, s.filename, CURRENT_TIMESTAMP(), s.metadata, s.yolo, s.deepface)
+                    """,
+                    params,
+                )
+        print(f"[snowflake] upsert_photos_bulk ok: {len(items)} photos")
+    except Exception as e:
+        print(f"[snowflake] upsert_photos_bulk failed: {e}")
+
+
+def search_photos_by_vector(
+    embedding: list[float],
+    user_id: str,
+    filters: Optional[dict] = None,
+    limit: int = 20,
+) -> list[dict]:
+    """
+    Rank the user's photos with VECTOR_COSINE_SIMILARITY on the warehouse.
+    Filters (same keys as db.search_photos_by_vector) become WHERE clauses,
+    so only the top `limit` rows leave Snowflake.
+    """
+    where = ["METADATA:user_id::STRING = %s", "EMBEDDING IS NOT NULL"]
+    params: list = [_dumps(embedding), user_id]
+
+    if filters:
+        if filters.get("person_id"):
+            where.append("ARRAY_CONTAINS(%s::VARIANT, METADATA:person_ids)")
+            params.append(filters["person_id"])
+        # Label filters are uncorrelated IN (… LATERAL FLATTEN …) subqueries —
+        # Snowflake rejects correlated subqueries over table functions.
+        if filters.get("objects"):
+            # Photos without YOLO data yet pass; CLIP ranking handles them.
+            where.append(
+                "(ARRAY_SIZE(YOLO_DATA) = 0 OR ID IN ("
+                "SELECT p.ID FROM photos p, LATERAL FLATTEN(input => p.YOLO_DATA) o "
+                "WHERE p.METADATA:user_id::STRING = %s "
+                "AND ARRAY_CONTAINS(LOWER(o.value:label::STRING)::VARIANT, PARSE_JSON(%s))))"
+            )
+            params += [user_id, _dumps([kw.lower() for kw in filters["objects"]])]
+        if filters.get("emotion"):
+            where.append(
+                "ID IN (SELECT p.ID FROM photos p, LATERAL FLATTEN(input => p.DEEPFACE_DATA) e "
+                "WHERE p.METADATA:user_id::STRING = %s "
+                "AND LOWER(e.value:dominant_emotion::STRING) = %s)"
+            )
+            params += [user_id, filters["emotion"].lower()]
+        if filters.get("exclude_low_value"):
+            where.append("COALESCE(METADATA:importance_score::FLOAT, 1.0) >= 0.4")
+
+    params.append(limit)
+    sql = f"""
+        SELECT ID, FILENAME, CREATED_AT, METADATA, YOLO_DATA, DEEPFACE_DATA,
+               VECTOR_COSINE_SIMILARITY(EMBEDDING, {_VECTOR_BIND}) AS SIMILARITY
+        FROM photos
+        WHERE {" AND ".join(where)}
+        ORDER BY SIMILARITY DESC
+        LIMIT %s
+    """
+    try:
+        with _get_conn() as conn:
+            rows = conn.cursor(snowflake.connector.DictCursor).execute(sql, params).fetchall()
+    except Exception as e:
+        print(f"[snowflake] search_photos_by_vector failed: {e}")
+        return []
+
+    return [
+        {
+            "id": r["ID"],
+            "filename": r["FILENAME"],
+            "created_at": r["CREATED_AT"],
+            "metadata": orjson.loads(r["METADATA"] or "{}"),
+            "detected_objects": orjson.loads(r["YOLO_DATA"] or "[]"),
+            "emotions": orjson.loads(r["DEEPFACE_DATA"] or "[]"),
+            "similarity": float(r["SIMILARITY"]),
+        }
+        for r in rows
+    ]
+
+
+# Label search statements are module constants so every request sends the
+# identical text and can hit Snowflake's result cache.
+_DISTINCT_LABELS_SQL = """
+SELECT 'object' AS KIND, o.value:label::STRING AS LABEL
+FROM photos p, LATERAL FLATTEN(input => p.YOLO_DATA) o
+WHERE p.METADATA:user_id::STRING = %s AND o.value:label IS NOT NULL
+UNION
+SELECT 'emotion', e.value:dominant_emotion::STRING
+FROM photos p, LATERAL FLATTEN(input => p.DEEPFACE_DATA) e
+WHERE p.METADATA:user_id::STRING = %s AND e.value:dominant_emotion IS NOT NULL
+"""
+
+# Flattened the same way as _DISTINCT_LABELS_SQL: an uncorrelated UNION of
+# matching IDs (Snowflake rejects correlated subqueries over FLATTEN).
+_PHOTOS_WITH_LABELS_SQL = """
+SELECT ID, METADATA, YOLO_DATA, DEEPFACE_DATA
+FROM photos
+WHERE ID IN (
+    SELECT p.ID
+    FROM photos p, LATERAL FLATTEN(input => p.YOLO_DATA) o
+    WHERE p.METADATA:user_id::STRING = %s
+      AND ARRAY_CONTAINS(o.value:label::VARIANT, PARSE_JSON(%s)::ARRAY)
+    UNION
+    SELECT p.ID
+    FROM photos p, LATERAL FLATTEN(input => p.DEEPFACE_DATA) e
+    WHERE p.METADATA:user_id::STRING = %s
+      AND ARRAY_CONTAINS(e.value:dominant_emotion::VARIANT, PARSE_JSON(%s)::ARRAY)
+)
+"""
+
+
+def get_distinct_labels(user_id: str) -> tuple[list[str], list[str]]:
+    """
+    (object labels, dominant emotions) across the user's photos. The JSON is
+    flattened and de-duplicated on the warehouse; only distinct labels come back.
+    """
+    try:
+        with _get_conn() as conn:
+            rows = conn.cursor().execute(_DISTINCT_LABELS_SQL, (user_id, user_id)).fetchall()
+    except Exception as e:
+        print(f"[snowflake] get_distinct_labels failed: {e}")
+        return [], []
+
+    objects = [label for kind, label in rows if kind == "object"]
+    emotions = [label for kind, label in rows if kind == "emotion"]
+    return objects, emotions
+
+
+def get_photos_with_labels(user_id: str, labels: list[str]) -> list[dict]:
+    """The user's photos with at least one YOLO label or dominant emotion in `labels`."""
+    if not labels:
+        return []
+    wanted = _dumps(labels)
+    try:
+        with _get_conn() as conn:
+            rows = (
+                conn.cursor(snowflake.connector.DictCursor)
+                .execute(_PHOTOS_WITH_LABELS_SQL, (user_id, wanted, user_id, wanted))
+                .fetchall()
+            )
+    except Exception as e:
+        print(f"[snowflake] get_photos_with_labels failed: {e}")
+        return []
+
+    photos = []
+    for r in rows:
+        yolo = orjson.loads(r["YOLO_DATA"] or "[]")
+        faces = orjson.loads(r["DEEPFACE_DATA"] or "[]")
+        photos.append({
+            "metadata": orjson.loads(r["METADATA"] or "{}"),
+            "yolo_labels": [o["label"] for o in yolo if "label" in o],
+            "dominant_emotions": [f["dominant_emotion"] for f in faces if "dominant_emotion" in f],
+            "id": r["ID"],
+        })
+    return photos
+
+
 def clear_photos(user_id: str) -> None:
     """Delete all photos for a user — called before re-uploading on app startup."""
     try:
@@ -3,9 +3,10 @@ Step 1 — Vision caption + tag extraction via Gemini.
 If GEMINI_API_KEY is not set, returns empty caption/tags and skips the API call.
 """
 
-import asyncio
 import json
-from backend.config import settings
+from functools import lru_cache
+
+from config import settings
 
 PROMPT = """You are a photo analysis assistant.
 Given an image, respond with a JSON object containing:
@@ -28,6 +29,14 @@ def _make_client():
 _client = _make_client()
 
 
+@lru_cache(maxsize=1)
+def _config():
+    from google.genai import types
+
+    # JSON mode — no markdown fences to strip from the reply
+    return types.GenerateContentConfig(response_mime_type="application/json")
+
+
 async def get_caption_and_tags(image_bytes: bytes) -> dict:
     if not _client:
         return {"caption": "", "tags": []}
@@ -35,14 +44,14 @@ async def get_caption_and_tags(image_bytes: bytes) -> dict:
     from google.genai import types
     image_part = types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg")
 
-    response = await asyncio.to_thread(
-        _client.models.generate_content,
+    # Native async client — no worker-thread hop per photo
+    response = await _client.aio.models.generate_content(
         model="gemini-1.5-flash",
         contents=[PROMPT, image_part],
+        config=_config(),
     )
 
     raw = response.text or "{}"
-    raw = raw.strip().removeprefix("```json").removeprefix("```").removesuffix("```").strip()
     try:
         result = json.loads(raw)
     except json.JSONDecodeError:
@@ -9,10 +9,15 @@ torch is already present via ultralytics, so open-clip-torch is lightweight.
 """
 
 import asyncio
+import contextlib
 import io
 from functools import lru_cache
 
+import numpy as np
 from PIL import Image
+
+from pipeline.executor import MODEL_POOL
+
 try:
     import pillow_heif
     pillow_heif.register_heif_opener()
@@ -20,42 +25,173 @@ except ImportError:
     pass  # HEIC support optional
 
 
+@lru_cache(maxsize=1)
+def _device() -> str:
+    import torch
+
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
 @lru_cache(maxsize=1)
 def _load():
     import open_clip
     model, _, preprocess = open_clip.create_model_and_transforms(
         "ViT-B-32", pretrained="openai"
     )
-    model.eval()
+    model.to(_device()).eval()
+    if _device() == "cpu" and not _cpu_has_bf16():
+        model = _quantize(model)
     tokenizer = open_clip.get_tokenizer("ViT-B-32")
+    _compile(model, tokenizer)
     return model, preprocess, tokenizer
 
 
-def embed_image(image_bytes: bytes) -> list[float]:
+def _quantize(model):
+    """Dynamic int8 weights for the Linear layers (MLPs + projections) — the
+    bulk of ViT-B-32's CPU time. Embeddings stay within ~1e-2 cosine of fp32.
+    Only used where there's no bf16 autocast to fall back on."""
+    import torch
+
+    try:
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    except Exception as e:  # no quantized engine on this build/platform
+        print(f"[clip] int8 quantization failed, using fp32 model: {e}")
+        return model
+
+
+def _compile(model, tokenizer) -> None:
+    """Swap in torch.compile'd encoders, warmed up here so the first request
+    doesn't pay the compile. Any failure (torch < 2, no C++ toolchain for
+    inductor) leaves the eager model in place."""
+    import torch
+
+    if not hasattr(torch, "compile"):
+        return
+    eager = model.encode_image, model.encode_text
+    try:
+        # dynamic=True: batch size (face crops) varies per photo — avoid a
+        # recompile for every new N
+        model.encode_image = torch.compile(model.encode_image, dynamic=True)
+        model.encode_text = torch.compile(model.encode_text, dynamic=True)
+        with torch.no_grad(), _autocast():
+            model.encode_image(torch.zeros(1, 3, 224, 224, device=_device()))
+            model.encode_text(tokenizer(["a photo"]).to(_device()))
+    except Exception as e:
+        print(f"[clip] torch.compile failed, using eager model: {e}")
+        model.encode_image, model.encode_text = eager
+
+
+@lru_cache(maxsize=1)
+def _cpu_has_bf16() -> bool:
+    import torch
+
+    cpu = getattr(torch, "cpu", None)
+    return any(
+        getattr(cpu, probe, lambda: False)()
+        for probe in ("_is_avx512_bf16_supported", "_is_amx_tile_supported")
+    )
+
+
+def _autocast():
+    """fp16 autocast on CUDA; bf16 where the CPU has native bf16 (AVX512-BF16 /
+    AMX); elsewhere a no-op, since emulated bf16 is slower than fp32."""
+    import torch
+
+    if _device() == "cuda":
+        return torch.autocast("cuda", dtype=torch.float16)
+    if _cpu_has_bf16():
+        return torch.autocast("cpu", dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def embed_image(image: bytes | Image.Image) -> list[float]:
+    return embed_image_array(image).tolist()
+
+
+def embed_image_array(image: bytes | Image.Image) -> np.ndarray:
+    """Same as embed_image, as a contiguous float32 array (no per-float Python objects).
+    Accepts encoded bytes or an already-decoded PIL image."""
+    return embed_images_array([image])[0]
+
+
+def embed_images_array(images: list[bytes | Image.Image]) -> np.ndarray:
+    """Embed many images in one forward pass — (N, D) float32, rows L2-normalized."""
     import torch
 
     model, preprocess, _ = _load()
-    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    tensor = preprocess(img).unsqueeze(0)
-    with torch.no_grad():
-        feat = model.encode_image(tensor)
-        feat = feat / feat.norm(dim=-1, keepdim=True)
-    return feat[0].tolist()
+    tensors = []
+    for image in images:
+        if isinstance(image, bytes):
+            image = Image.open(io.BytesIO(image))
+        img = image if image.mode == "RGB" else image.convert("RGB")
+        tensors.append(preprocess(img))
+    return _encode_image_batch(model, torch.stack(tensors))
+
+
+# CLIP's input normalization (open_clip's OPENAI_DATASET_MEAN/STD)
+_CLIP_MEAN = (0.48145466, 0.4578275, 0.40821073)
+_CLIP_STD = (0.26862954, 0.26130258, 0.27577711)
+
+
+def embed_images_from_arrays(arrays: list[np.ndarray]) -> np.ndarray:
+    """Like embed_images_array for HxWx3 uint8 crops already at 224x224:
+    one stacked tensor, normalized in place, no per-image PIL transform."""
+    import torch
+
+    model, _, _ = _load()
+    batch = torch.from_numpy(np.stack(arrays)).permute(0, 3, 1, 2).float().div_(255)
+    mean = torch.tensor(_CLIP_MEAN).view(1, 3, 1, 1)
+    std = torch.tensor(_CLIP_STD).view(1, 3, 1, 1)
+    batch.sub_(mean).div_(std)
+    return _encode_image_batch(model, batch.contiguous())
+
+
+def _encode_image_batch(model, batch) -> np.ndarray:
+    import torch
+
+    if _device() == "cuda":
+        # Pinned host memory lets the copy run async with the forward pass
+        batch = batch.pin_memory().to("cuda", non_blocking=True)
+    with torch.no_grad(), _autocast():
+        feat = model.encode_image(batch)
+    feat = feat.float()  # normalize in fp32 whatever autocast ran in
+    feat = feat / feat.norm(dim=-1, keepdim=True)
+    return feat.cpu().numpy().astype(np.float32, copy=False)
 
 
 def embed_text(text: str) -> list[float]:
+    # CLIP's tokenizer lowercases and collapses whitespace itself, so queries
+    # differing only in case/spacing share a cache entry with no change in output.
+    return _embed_text_cached(" ".join(text.lower().split())).astype(np.float32).tolist()
+
+
+@lru_cache(maxsize=4096)
+def _embed_text_cached(text: str) -> np.ndarray:
+    """Search traffic is dominated by a few repeated queries — skip the encoder for them.
+    Entries are float16 arrays (1 KiB each) rather than tuples of Python floats."""
     import torch
 
     model, _, tokenizer = _load()
-    tokens = tokenizer([text])
-    with torch.no_grad():
+    tokens = tokenizer([text]).to(_device(), non_blocking=True)
+    with torch.no_grad(), _autocast():
         feat = model.encode_text(tokens)
-        feat = feat / feat.norm(dim=-1, keepdim=True)
-    return feat[0].tolist()
+    feat = feat.float()
+    feat = feat / feat.norm(dim=-1, keepdim=True)
+    emb = feat[0].cpu().numpy().astype(np.float16)
+    emb.flags.writeable = False  # shared between callers
+    return emb
+
+
+async def embed_image_async(image: bytes | Image.Image) -> list[float]:
+    return await asyncio.get_running_loop().run_in_executor(MODEL_POOL, embed_image, image)
+
 
+async def embed_image_modal(image_bytes: bytes) -> list[float]:
+    """Embed on the deployed Modal GPU class (backend/pipeline/modal_app.py)
+    instead of running the ViT forward pass on the host CPU."""
+    from backend.pipeline.modal_app import predict_remote
 
-async def embed_image_async(image_bytes: bytes) -> list[float]:
-    return await asyncio.to_thread(embed_image, image_bytes)
+    return (await predict_remote(image_bytes))["embedding"]
 
 
 async def embed_text_async(text: str) -> list[float]:
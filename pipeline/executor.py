@@ -0,0 +1,30 @@
+"""
+Thread pool for model inference (CLIP, YOLO, MediaPipe, scoring).
+
+Kept apart from asyncio's default executor, which runs up to
+min(32, cpu_count + 4) threads — too many for torch work that is already
+multi-threaded inside each call. I/O hops (Snowflake, file reads) stay on
+the default executor.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+_CPUS = os.cpu_count() or 2
+MODEL_WORKERS = max(2, _CPUS // 2)
+
+
+def _init_worker() -> None:
+    # Split the cores between workers instead of every torch op grabbing all of them
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(max(1, _CPUS // MODEL_WORKERS))
+
+
+MODEL_POOL = ThreadPoolExecutor(
+    max_workers=MODEL_WORKERS,
+    thread_name_prefix="model",
+    initializer=_init_worker,
+)
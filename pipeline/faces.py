@@ -8,55 +8,79 @@ and requires no extra API key.
 
 import asyncio
 import io
+import threading
+from functools import lru_cache
 
 import numpy as np
 from PIL import Image
 
-from backend.db import get_or_create_person
-from pipeline.clip_embed import embed_image
+from db import get_or_create_person_batch  # the module backend/main.py uses
+from pipeline.clip_embed import embed_images_from_arrays
+from pipeline.executor import MODEL_POOL
 
 
-def _detect_faces_mediapipe(image_bytes: bytes) -> list[bytes]:
+@lru_cache(maxsize=1)
+def _face_detector():
+    """Built once — constructing FaceDetection rebuilds its TFLite graph.
+    None if mediapipe isn't installed."""
     try:
         import mediapipe as mp
     except ImportError:
+        return None
+    return mp.solutions.face_detection.FaceDetection(
+        model_selection=1, min_detection_confidence=0.5
+    )
+
+
+# One graph, so .process() calls from concurrent pipelines take turns
+_detector_lock = threading.Lock()
+
+
+def _detect_faces_mediapipe(image: bytes | Image.Image) -> list[np.ndarray]:
+    detector = _face_detector()
+    if detector is None:
         return []
+    import cv2
 
-    mp_face = mp.solutions.face_detection
-    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    img_array = np.array(img)
+    img = Image.open(io.BytesIO(image)) if isinstance(image, bytes) else image
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img_array = np.asarray(img)
     h, w = img_array.shape[:2]
 
-    face_crops: list[bytes] = []
-    with mp_face.FaceDetection(model_selection=1, min_detection_confidence=0.5) as detector:
+    # 224x224 uint8 arrays — CLIP batches them directly, no JPEG round-trip
+    face_crops: list[np.ndarray] = []
+    with _detector_lock:
         results = detector.process(img_array)
-        if not results.detections:
-            return []
+    if not results.detections:
+        return []
 
-        for detection in results.detections:
-            bb = detection.location_data.relative_bounding_box
-            x1 = max(0, int(bb.xmin * w))
-            y1 = max(0, int(bb.ymin * h))
-            x2 = min(w, int((bb.xmin + bb.width) * w))
-            y2 = min(h, int((bb.ymin + bb.height) * h))
+    for detection in results.detections:
+        bb = detection.location_data.relative_bounding_box
+        x1 = max(0, int(bb.xmin * w))
+        y1 = max(0, int(bb.ymin * h))
+        x2 = min(w, int((bb.xmin + bb.width) * w))
+        y2 = min(h, int((bb.ymin + bb.height) * h))
 
-            face_img = img.crop((x1, y1, x2, y2)).resize((224, 224))
-            buf = io.BytesIO()
-            face_img.save(buf, format="JPEG")
-            face_crops.append(buf.getvalue())
+        if x2 <= x1 or y2 <= y1:
+            continue
+        # Slice is a view into img_array — cv2 resizes it without a PIL copy
+        crop = img_array[y1:y2, x1:x2]
+        face_crops.append(cv2.resize(crop, (224, 224), interpolation=cv2.INTER_AREA))
 
     return face_crops
 
 
-async def detect_and_cluster_faces(image_bytes: bytes, user_id: str) -> list[str]:
-    face_crops = _detect_faces_mediapipe(image_bytes)
+async def detect_and_cluster_faces(image: bytes | Image.Image, user_id: str) -> list[str]:
+    loop = asyncio.get_running_loop()
+    face_crops = await loop.run_in_executor(MODEL_POOL, _detect_faces_mediapipe, image)
     if not face_crops:
         return []
 
-    person_ids: list[str] = []
-    for face_bytes in face_crops:
-        embedding = await asyncio.to_thread(embed_image, face_bytes)
-        person_id = get_or_create_person(user_id, embedding)
-        person_ids.append(person_id)
+    # (F, D) float32 from one batched CLIP pass, handed straight to the matcher
+    embeddings = await loop.run_in_executor(MODEL_POOL, embed_images_from_arrays, face_crops)
+    # SQLite write transaction — default executor, like the other DB hops
+    person_ids = await loop.run_in_executor(None, get_or_create_person_batch, user_id, embeddings)
 
-    return list(set(person_ids))
+    # Dedup in detection order, so the first id is stable across runs
+    return list(dict.fromkeys(person_ids))
@@ -8,6 +8,23 @@ import io
 from functools import lru_cache
 from PIL import Image
 from backend.models import DetectedObject
+from pipeline.executor import MODEL_POOL
+
+
+# YOLO's input size — images are downscaled to it in PIL before inference
+IMGSZ = 640
+
+# Micro-batching: images arriving within BATCH_WINDOW_S share one YOLO forward pass
+MAX_BATCH = 8
+BATCH_WINDOW_S = 0.005
+
+_queue: asyncio.Queue | None = None
+
+
+@lru_cache(maxsize=1)
+def _cuda() -> bool:
+    import torch
+    return torch.cuda.is_available()
 
 
 @lru_cache(maxsize=1)
@@ -16,24 +33,102 @@ def _get_model():
     return YOLO("yolov8n.pt")
 
 
-async def detect_objects(image_bytes: bytes) -> list[DetectedObject]:
+async def detect_objects(image: bytes | Image.Image) -> list[DetectedObject]:
+    """Accepts encoded bytes or an already-decoded PIL image (skips a JPEG decode).
+    Batched with other in-flight images when the batcher is running."""
     loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _detect_sync, image_bytes)
+    if _queue is None:
+        return await loop.run_in_executor(MODEL_POOL, _detect_sync, image)
+    img = await loop.run_in_executor(MODEL_POOL, _prepare, image)
+    fut = loop.create_future()
+    await _queue.put((fut, img))
+    return await fut
+
+
+def _prepare(image: bytes | Image.Image) -> Image.Image:
+    if isinstance(image, bytes):
+        image = Image.open(io.BytesIO(image))
+        image.draft("RGB", (IMGSZ, IMGSZ))  # JPEG: decode at reduced scale
+    img = image if image.mode == "RGB" else image.convert("RGB")
+    if max(img.size) > IMGSZ:
+        # resize() returns a copy — the caller's image may be shared
+        scale = IMGSZ / max(img.size)
+        img = img.resize((round(img.width * scale), round(img.height * scale)), Image.BILINEAR)
+    return img
+
+
+def _detect_batch(images: list[Image.Image]) -> list[list[DetectedObject]]:
+    """One forward pass over every image — one result list per image."""
+    cuda = _cuda()
+    results = _get_model()(images, imgsz=IMGSZ, device=0 if cuda else "cpu", half=cuda, verbose=False)
+    return [_objects(r) for r in results]
 
 
-def _detect_sync(image_bytes: bytes) -> list[DetectedObject]:
-    model = _get_model()
-    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    results = model(img, verbose=False)
+def _detect_sync(image: bytes | Image.Image) -> list[DetectedObject]:
+    return _detect_batch([_prepare(image)])[0]
 
+
+def _objects(r) -> list[DetectedObject]:
     seen: set[str] = set()
     objects: list[DetectedObject] = []
-    for r in results:
-        for box in r.boxes:
-            label = r.names[int(box.cls[0])]
-            conf = float(box.conf[0])
-            if label not in seen:
-                seen.add(label)
-                objects.append(DetectedObject(label=label, confidence=round(conf, 3)))
+    for box in r.boxes:
+        label = r.names[int(box.cls[0])]
+        conf = float(box.conf[0])
+        if label not in seen:
+            seen.add(label)
+            objects.append(DetectedObject(label=label, confidence=round(conf, 3)))
 
     return objects
+
+
+def _fail(pending: list, exc: BaseException) -> None:
+    for fut, _ in pending:
+        if not fut.done():
+            fut.set_exception(exc)
+
+
+async def _object_batcher(queue: asyncio.Queue) -> None:
+    loop = asyncio.get_running_loop()
+    pending: list = []
+    try:
+        while True:
+            pending = [await queue.get()]
+            deadline = loop.time() + BATCH_WINDOW_S
+            while len(pending) < MAX_BATCH:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = await loop.run_in_executor(MODEL_POOL, _detect_batch, [img for _, img in pending])
+            except Exception as e:
+                _fail(pending, e)
+                continue
+
+            for (fut, _), objects in zip(pending, results):
+                if not fut.done():
+                    fut.set_result(objects)
+    except asyncio.CancelledError:
+        # Stopped mid-batch — its callers would otherwise await forever
+        _fail(pending, RuntimeError("object batcher stopped"))
+        raise
+
+
+def start_object_batcher() -> asyncio.Task:
+    """Start the batching loop on the running event loop (call from the app lifespan)."""
+    global _queue
+    _queue = asyncio.Queue()
+    return asyncio.create_task(_object_batcher(_queue))
+
+
+def stop_object_batcher(task: asyncio.Task) -> None:
+    """Stop the loop and fail every queued request, so no caller awaits forever."""
+    global _queue
+    queue, _queue = _queue, None
+    while queue is not None and not queue.empty():
+        _fail([queue.get_nowait()], RuntimeError("object batcher stopped"))
+    task.cancel()
@@ -4,44 +4,62 @@ Called as a FastAPI BackgroundTask after upload.
 """
 
 import asyncio
+import io
 import json
-from backend.db import update_photo_pipeline_result
-import backend.snowflake_db as sf_db
+
+from PIL import Image
+# Same module names backend/main.py imports (it runs from backend/), so pipeline
+# writes invalidate the very caches /search and /people read — `backend.db`
+# would be a second copy of the module with caches of its own.
+from db import update_photo_pipeline_result
+import snowflake_db as sf_db
 from backend.models import PipelineResult
 from pipeline.caption import get_caption_and_tags
 from pipeline.yolo_objects import detect_objects
 from pipeline.emotion import detect_emotions
 from pipeline.faces import detect_and_cluster_faces
 from pipeline.scoring import score_photo
-from pipeline.clip_embed import embed_image_async
+from config import settings
+from pipeline.clip_embed import embed_image_async, embed_image_modal
+from pipeline.executor import MODEL_POOL
+
+
+async def _embed(image_bytes: bytes, img: Image.Image) -> list[float]:
+    if settings.modal_vision:
+        try:
+            return await embed_image_modal(image_bytes)
+        except Exception as exc:
+            print(f"[pipeline] Modal CLIP failed, embedding locally: {exc}")
+    return await embed_image_async(img)
 
 
 async def run_pipeline(photo_id: str, user_id: str, storage_url: str, image_bytes: bytes) -> None:
+    loop = asyncio.get_running_loop()
     try:
-        # Steps 1, 2, 5 can run in parallel (don't depend on each other)
+        # Gemini gets the encoded bytes; the local models share one decoded image
         caption_task = asyncio.create_task(get_caption_and_tags(image_bytes))
-        objects_task = asyncio.create_task(detect_objects(image_bytes))
+        img = await loop.run_in_executor(None, lambda: Image.open(io.BytesIO(image_bytes)).convert("RGB"))
 
-        caption_result, objects = await asyncio.gather(caption_task, objects_task)
+        # Only emotion detection needs the caption — everything else starts now
+        objects_task = asyncio.create_task(detect_objects(img))
+        faces_task = asyncio.create_task(detect_and_cluster_faces(img, user_id))
+        # Scoring is sync — run in a thread to not block the event loop
+        scoring_task = loop.run_in_executor(MODEL_POOL, score_photo, image_bytes, img)
+        # CLIP image embedding — stored so text queries can rank images by cosine similarity
+        embedding_task = asyncio.create_task(_embed(image_bytes, img))
 
+        caption_result = await caption_task
         caption = caption_result.get("caption", "")
         tags = caption_result.get("tags", [])
 
-        # Steps 3 and 4 use caption and image_bytes
-        emotion_task = asyncio.create_task(detect_emotions(image_bytes, caption))
-        faces_task = asyncio.create_task(detect_and_cluster_faces(image_bytes, user_id))
-
-        # Scoring is sync — run in executor to not block event loop
-        loop = asyncio.get_event_loop()
-        scoring_task = loop.run_in_executor(None, score_photo, image_bytes)
-
-        emotions, person_ids, (importance_score, flags) = await asyncio.gather(
-            emotion_task, faces_task, scoring_task
+        emotions, objects, person_ids, (importance_score, flags), embedding = await asyncio.gather(
+            detect_emotions(image_bytes, caption),
+            objects_task,
+            faces_task,
+            scoring_task,
+            embedding_task,
         )
 
-        # CLIP image embedding — stored so text queries can rank images by cosine similarity
-        embedding = await embed_image_async(image_bytes)
-
         result = PipelineResult(
             photo_id=photo_id,
             caption=caption,
@@ -63,9 +81,9 @@ async def run_pipeline(photo_id: str, user_id: str, storage_url: str, image_byte
             "low_value_flags": result.low_value_flags,
             "embedding": embedding,
         }
-        update_photo_pipeline_result(photo_id, pipeline_data)
+        await loop.run_in_executor(None, update_photo_pipeline_result, photo_id, pipeline_data)
         # Mirror to Snowflake in a thread (sync connector)
-        await asyncio.to_thread(sf_db.update_photo_pipeline_result, photo_id, pipeline_data)
+        await loop.run_in_executor(None, sf_db.update_photo_pipeline_result, photo_id, pipeline_data)
 
     except Exception as exc:
         # Don't crash the server — log and move on
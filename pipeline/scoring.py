@@ -7,29 +7,40 @@ Returns:
 """
 
 import io
-import hashlib
+import threading
 import numpy as np
 from PIL import Image
 
-# In-memory duplicate tracking (per process lifetime — good enough for demo)
-_seen_hashes: set[str] = set()
+# In-memory duplicate tracking (per process lifetime — good enough for demo).
+# 64-bit dHashes, so re-encoded/resized copies match too, not just identical files.
+# Kept in one contiguous uint64 array (capacity doubles as it fills), so a
+# near-duplicate check is a single vectorized XOR + popcount pass.
+_seen_hashes = np.empty(1024, dtype=np.uint64)
+_seen_count = 0
+_seen_lock = threading.Lock()  # score_photo runs on several executor threads
+_NEAR_DUPLICATE_BITS = 5  # max Hamming distance still counted as a duplicate
 
+# Set bits per byte value, for popcount on numpy < 2 (no np.bitwise_count)
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
 
-def score_photo(image_bytes: bytes) -> tuple[float, list[str]]:
+
+def score_photo(image_bytes: bytes, img: Image.Image | None = None) -> tuple[float, list[str]]:
+    """`img` is the already-decoded RGB image, if the caller has one;
+    `image_bytes` is only decoded when it isn't passed."""
     flags: list[str] = []
     penalty = 0.0
 
-    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    if img is None:
+        img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
     w, h = img.size
-    arr = np.array(img)
+    arr = np.asarray(img)  # read-only view of PIL's buffer — no copy
+    # Channel mean straight into float32 (no float64 intermediate)
+    gray = arr.mean(axis=2, dtype=np.float32)
 
-    # --- Duplicate detection ---
-    phash = hashlib.md5(image_bytes).hexdigest()
-    if phash in _seen_hashes:
+    # --- Duplicate detection (dHash) ---
+    if _is_duplicate(_dhash(gray)):
         flags.append("duplicate")
         penalty += 0.6
-    else:
-        _seen_hashes.add(phash)
 
     # --- Screenshot detection (very wide or very tall aspect ratio + common screen resolutions) ---
     ratio = w / h if h else 1
@@ -41,14 +52,15 @@ def score_photo(image_bytes: bytes) -> tuple[float, list[str]]:
         penalty += 0.2
 
     # --- Blurriness (Laplacian variance) ---
-    gray = np.mean(arr, axis=2).astype(np.float32)
     laplacian = _laplacian_variance(gray)
     if laplacian < 50:
         flags.append("blurry")
         penalty += 0.4
 
     # --- Low brightness ---
-    brightness = arr.mean()
+    # Mean over all channels == mean of the per-pixel channel means, so reuse
+    # `gray` instead of another pass over the full RGB array
+    brightness = gray.mean(dtype=np.float64)
     if brightness < 20:
         flags.append("dark")
         penalty += 0.3
@@ -63,13 +75,42 @@ def score_photo(image_bytes: bytes) -> tuple[float, list[str]]:
     return round(score, 3), list(set(flags))
 
 
+def _dhash(gray: np.ndarray) -> int:
+    """64-bit difference hash: sign of horizontal gradients on a 9x8 thumbnail."""
+    small = np.asarray(Image.fromarray(gray).resize((9, 8), Image.BILINEAR))
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
 def _laplacian_variance(gray: np.ndarray) -> float:
-    """Simple discrete Laplacian for blur detection (numpy-only)."""
-    lap = (
-        gray[1:-1, 1:-1] * -4
-        + gray[0:-2, 1:-1]
-        + gray[2:,   1:-1]
-        + gray[1:-1, 0:-2]
-        + gray[1:-1, 2:]
-    )
+    """Simple discrete Laplacian for blur detection (numpy-only).
+    Accumulates into one buffer — no per-term temporaries."""
+    lap = np.multiply(gray[1:-1, 1:-1], -4, dtype=np.float32)
+    lap += gray[0:-2, 1:-1]
+    lap += gray[2:,   1:-1]
+    lap += gray[1:-1, 0:-2]
+    lap += gray[1:-1, 2:]
     return float(lap.var())
+
+
+def _hamming(hashes: np.ndarray, h: int) -> np.ndarray:
+    xor = hashes ^ np.uint64(h)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(xor)
+    return _BYTE_POPCOUNT[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def _is_duplicate(h: int) -> bool:
+    """True if a hash within _NEAR_DUPLICATE_BITS was seen; otherwise records `h`."""
+    global _seen_hashes, _seen_count
+    with _seen_lock:
+        seen = _seen_hashes[:_seen_count]
+        if _seen_count and _hamming(seen, h).min() <= _NEAR_DUPLICATE_BITS:
+            return True
+        if _seen_count == len(_seen_hashes):
+            grown = np.empty(2 * len(_seen_hashes), dtype=np.uint64)
+            grown[:_seen_count] = seen
+            _seen_hashes = grown
+        _seen_hashes[_seen_count] = h
+        _seen_count += 1
+        return False
@@ -6,16 +6,33 @@ Replaces OpenAI Vision for offline/faster inference.
 import asyncio
 import io
 from PIL import Image
+import torch
 from ultralytics import YOLO
 from backend.models import DetectedObject
+from pipeline.executor import MODEL_POOL
 
 model = YOLO("yolov8n.pt")
 
-def _run_yolo(image_bytes: bytes) -> list[DetectedObject]:
+# YOLO's input size. Downscaling to it in PIL/uint8 beats letting ultralytics
+# resize a full-resolution float tensor.
+IMGSZ = 640
+_CUDA = torch.cuda.is_available()
 
-    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+def _run_yolo(image: bytes | Image.Image) -> list[DetectedObject]:
 
-    results = model(image)
+    if isinstance(image, bytes):
+        image = Image.open(io.BytesIO(image))
+        image.draft("RGB", (IMGSZ, IMGSZ))  # JPEG: decode at reduced scale
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if max(image.size) > IMGSZ:
+        # resize(), not thumbnail(): the decoded image is shared with other steps
+        scale = IMGSZ / max(image.size)
+        image = image.resize(
+            (round(image.width * scale), round(image.height * scale)), Image.BILINEAR
+        )
+
+    results = model(image, imgsz=IMGSZ, device=0 if _CUDA else "cpu", half=_CUDA, verbose=False)
     
     detected_items = []
     for result in results:
@@ -32,5 +49,5 @@ def _run_yolo(image_bytes: bytes) -> list[DetectedObject]:
                 
     return detected_items
 
-async def detect_objects(image_bytes: bytes) -> list[DetectedObject]:
-    return await asyncio.to_thread(_run_yolo, image_bytes)
\ No newline at end of file
+async def detect_objects(image: bytes | Image.Image) -> list[DetectedObject]:
+    return await asyncio.get_running_loop().run_in_executor(MODEL_POOL, _run_yolo, image)
\ No newline at end of file